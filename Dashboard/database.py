@@ -0,0 +1,250 @@
+"""This module contains the database access shared by every dashboard page."""
+from contextlib import contextmanager
+from psycopg2 import Error, OperationalError
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+import streamlit as st
+import pandas as pd
+import sys
+import threading
+import urllib.parse as up
+from search_index import RecruitSearchIndex
+
+# Reads are shared across sessions and reruns for this long, or until a page writes and calls invalidate_data
+DATA_TTL_SECONDS = 300
+# Recruits shown per page of the home page's table
+PAGE_SIZE = 50
+# The connections the dashboard process opens and keeps, however many sessions are running
+MAX_CONNECTIONS = 5
+
+# Compact dtypes of the dashboard's frames: 'category' for low-cardinality text, 'datetime' for dates
+# and 'id' for integer keys to downcast. The dashboard is deployed without the ETL pipeline, so it
+# keeps its own schemas rather than importing "ETL Pipeline/frame_schema.py"
+LIVE_DATA_SCHEMA = {
+    'member_id': 'id',
+    'team_leader_name': 'category',
+    'role_name': 'category',
+    'purchase': 'category',
+    'training_date': 'category',
+    'start_date': 'datetime',
+    'thirty_days': 'datetime',
+    'ninety_days': 'datetime',
+    'one_eighty_days': 'datetime',
+    'newcomer_demo': 'datetime'
+}
+
+CALENDAR_SCHEMA = {
+    'training_date_id': 'id',
+    'start_date': 'datetime',
+    'thirty_days': 'datetime',
+    'ninety_days': 'datetime',
+    'one_eighty_days': 'datetime'
+}
+
+# recruits_overview is a materialized view of the recruits join, refreshed after every load and write
+LIVE_DATA_SQL = """
+SELECT member_id, member_name, team_leader_name, recruiting_advisor_name, role_name, purchase, training_date,
+  start_date, thirty_days, ninety_days, one_eighty_days, newcomer_demo, first_sale, second_sale, third_sale,
+  fourth_sale, fifth_sale, sixth_sale, seventh_sale, eighth_sale
+FROM recruits_overview
+ORDER BY team_leader_name, role_name;
+"""
+
+# Pages are keyed on (team leader, member id); recruits without a team leader sort first, under ''
+PAGE_KEY = "COALESCE(team_leader_name, '')"
+
+REFRESH_OVERVIEW_SQL = "REFRESH MATERIALIZED VIEW CONCURRENTLY recruits_overview;"
+
+CALENDAR_SQL = "SELECT * FROM calendar_dates WHERE training_date_id > 0;"
+
+TEAM_LEADERS_SQL = "SELECT name FROM members WHERE role_id_fk = 1;"
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Casts the columns of a dataframe named in a schema to their compact dtypes"""
+    columns = {}
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        if kind == 'id':
+            columns[column] = pd.to_numeric(df[column], downcast='integer')
+        elif kind == 'datetime':
+            columns[column] = pd.to_datetime(df[column], errors='coerce')
+        else:
+            columns[column] = df[column].astype(kind)
+    return df.assign(**columns)
+
+
+def is_healthy(conn: connection) -> bool:
+    """Checks that a pooled connection is open and still reaches the server"""
+    if conn.closed:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1;")
+        cursor.close()
+        conn.rollback()
+        return True
+    except Error:
+        return False
+
+
+class ConnectionPool:
+    """A bounded pool of database connections shared by every session. Borrowers wait for
+    a free connection instead of failing, and each connection is checked before it is lent.
+    A session that borrows again while it holds a connection, e.g. get_data after a write,
+    gets the same connection, so a session never holds two and full pools cannot deadlock."""
+
+    def __init__(self, max_connections: int, **connect_args):
+        # psycopg2 closes connections handed back beyond minconn, so every connection is kept
+        self.max_connections = max_connections
+        self.pool = ThreadedConnectionPool(max_connections, max_connections, **connect_args)
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.borrowed = threading.local()
+
+    def healthy_connection(self) -> connection:
+        """Takes connections from the pool until one passes the health check, discarding the rest.
+        Idle connections can all go stale at once, e.g. after a server restart, and once they are
+        discarded the pool opens fresh ones, so only an unreachable server gets past the loop."""
+        for _ in range(self.max_connections + 1):
+            conn = self.pool.getconn()
+            if is_healthy(conn):
+                return conn
+            self.pool.putconn(conn, close=True)
+        raise OperationalError("No healthy database connection could be opened")
+
+    @contextmanager
+    def connection(self):
+        """Lends a healthy connection for one operation, rolling back anything left uncommitted when it comes back"""
+        if getattr(self.borrowed, "conn", None) is not None:
+            yield self.borrowed.conn
+            return
+        with self.slots:
+            conn = self.healthy_connection()
+            self.borrowed.conn = conn
+            try:
+                yield conn
+            finally:
+                self.borrowed.conn = None
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+
+@st.cache_resource
+def get_connection_pool() -> ConnectionPool:   # pragma: no cover
+    """Opens the process-wide connection pool once, for every page and session to share."""
+    try:
+        up.uses_netloc.append("postgres")
+        url = up.urlparse(st.secrets.db_credentials.url)
+        pool = ConnectionPool(MAX_CONNECTIONS,
+        database=url.path[1:],
+        user=url.username,
+        password=url.password,
+        host=url.hostname,
+        port=url.port
+        )
+        print("Database connection pool established successfully.")
+        return pool
+    except Error as err:
+        print("Error connecting to database: ", err)
+        sys.exit()
+
+
+def pooled_connection():
+    """Borrows a connection from the shared pool for the length of a with block"""
+    return get_connection_pool().connection()
+
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Returns the recruits, calendar and team leaders, querying the database only when the cache is stale.
+    Every caller gets its own copy, so pages can add columns without affecting each other."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(LIVE_DATA_SQL)
+        rows = cursor.fetchall()
+        live_dataframe = apply_schema(pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description]), LIVE_DATA_SCHEMA)
+        cursor.execute(CALENDAR_SQL)
+        rows = cursor.fetchall()
+        calendar_dataframe = apply_schema(pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description]), CALENDAR_SCHEMA)
+        cursor.execute(TEAM_LEADERS_SQL)
+        rows = cursor.fetchall()
+        team_leader_dataframe = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+        cursor.close()
+    return live_dataframe, calendar_dataframe, team_leader_dataframe
+
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_lookups() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the calendar and team leaders without the recruits, for pages that page through recruits_overview"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(CALENDAR_SQL)
+        rows = cursor.fetchall()
+        calendar_dataframe = apply_schema(pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description]), CALENDAR_SCHEMA)
+        cursor.execute(TEAM_LEADERS_SQL)
+        rows = cursor.fetchall()
+        team_leader_dataframe = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
+        cursor.close()
+    return calendar_dataframe, team_leader_dataframe
+
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_recruits_page(team_leaders: tuple, year: int = None, role: str = None, key: tuple = None,
+                      backwards: bool = False, page_size: int = PAGE_SIZE) -> tuple[pd.DataFrame, bool]:
+    """Returns one page of recruits matching the filters and whether more match beyond it.
+    The page starts after key, or ends before it when going backwards; None in team_leaders
+    selects recruits without a team leader. Filtering and paging run in SQL on the page index."""
+    conditions = [f"{PAGE_KEY} = ANY(%(team_leaders)s)"]
+    params = {"team_leaders": ['' if leader is None else leader for leader in team_leaders], "limit": page_size + 1}
+    if year is not None:
+        conditions.append("start_date >= make_date(%(year)s, 1, 1) AND start_date < make_date(%(year)s + 1, 1, 1)")
+        params["year"] = int(year)
+    if role is not None:
+        conditions.append("role_name = %(role)s")
+        params["role"] = role
+    if key is not None:
+        conditions.append(f"({PAGE_KEY}, member_id) {'<' if backwards else '>'} (%(key_leader)s, %(key_member_id)s)")
+        params["key_leader"], params["key_member_id"] = key[0] or '', int(key[1])
+    order = "DESC" if backwards else "ASC"
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""SELECT member_id, member_name, team_leader_name, recruiting_advisor_name, role_name, purchase,
+  training_date, start_date, thirty_days, ninety_days, one_eighty_days, newcomer_demo, first_sale, second_sale,
+  third_sale, fourth_sale, fifth_sale, sixth_sale, seventh_sale, eighth_sale
+FROM recruits_overview
+WHERE {" AND ".join(conditions)}
+ORDER BY {PAGE_KEY} {order}, member_id {order}
+LIMIT %(limit)s;""", params)
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        cursor.close()
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    return apply_schema(pd.DataFrame(rows, columns=columns), LIVE_DATA_SCHEMA), more
+
+
+@st.cache_resource(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_search_index() -> RecruitSearchIndex:
+    """Builds the name search index once per version of the recruits and shares it between sessions"""
+    live_dataframe, calendar_dataframe, team_leader_dataframe = get_data()
+    return RecruitSearchIndex(live_dataframe)
+
+
+def invalidate_data() -> None:
+    """Refreshes recruits_overview after a committed write and drops the cached reads, so the next get_data sees the change"""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(REFRESH_OVERVIEW_SQL)
+        cursor.close()
+        conn.commit()
+    get_data.clear()
+    get_lookups.clear()
+    get_recruits_page.clear()
+    get_search_index.clear()
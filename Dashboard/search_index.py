@@ -0,0 +1,90 @@
+"""This module contains the n-gram index the search page uses to find recruits by name."""
+from collections import Counter
+import heapq
+import unicodedata
+import pandas as pd
+
+SEARCH_COLUMNS = ['member_name', 'team_leader_name', 'recruiting_advisor_name']
+# Matches returned per search
+SEARCH_LIMIT = 20
+# Share of the search's trigrams a name must contain to match, so a typo or two still finds it
+MIN_SCORE = 0.5
+# Score of a name containing the search inside a word rather than at the start of one
+INFIX_SCORE = 0.9
+# Searches shorter than this share too few trigrams with the names containing them, so they are looked up by word prefix
+PREFIX_LENGTH = 3
+
+
+def name_key(name: str) -> str:
+    """Case-folds a name, strips its accents and collapses its whitespace,
+    the same key the ETL's name matcher loads members by"""
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split()).casefold()
+
+
+def trigrams(key: str) -> set:
+    """Splits a name key into trigrams, padded like pg_trgm"""
+    padded = f"  {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def word_prefixes(key: str) -> set:
+    """Returns the prefixes shorter than PREFIX_LENGTH of every word in a name key"""
+    return {word[:length] for word in key.split() for length in range(1, PREFIX_LENGTH)}
+
+
+class RecruitSearchIndex:
+    """Indexes the member, team leader and recruiting advisor names of the recruits frame by trigram,
+    so a search only scores the names sharing a trigram with it. A name scores 1 if one of its words
+    starts with the search, otherwise the share of the search's trigrams it contains. Searches shorter
+    than PREFIX_LENGTH only match the start of a word, from an index of word prefixes. Each recruit
+    ranks by its best scoring name, preferring its own name over its team leader's and advisor's."""
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data.reset_index(drop=True)
+        self.keys = []
+        self.rows = []
+        self.index = {}
+        self.prefixes = {}
+        key_ids = {}
+        for column in SEARCH_COLUMNS:
+            for row, name in self.data[column].items():
+                if pd.isna(name):
+                    continue
+                key = name_key(name)
+                if key not in key_ids:
+                    key_ids[key] = len(self.keys)
+                    self.keys.append(key)
+                    self.rows.append({})
+                    for trigram in trigrams(key):
+                        self.index.setdefault(trigram, []).append(key_ids[key])
+                    for prefix in word_prefixes(key):
+                        self.prefixes.setdefault(prefix, []).append(key_ids[key])
+                self.rows[key_ids[key]].setdefault(row, SEARCH_COLUMNS.index(column))
+
+    def scores(self, query: str) -> dict:
+        """Returns the score of every name key id matching a search"""
+        key = name_key(query)
+        if len(key) < PREFIX_LENGTH:
+            return dict.fromkeys(self.prefixes.get(key, ()), 1.0)
+        query_trigrams = trigrams(key)
+        shared = Counter(key_id for trigram in query_trigrams for key_id in self.index.get(trigram, ()))
+        scores = {key_id: count / len(query_trigrams) for key_id, count in shared.items()
+                  if count / len(query_trigrams) >= MIN_SCORE}
+        for key_id in shared:
+            if f" {key}" in f" {self.keys[key_id]}":
+                scores[key_id] = 1.0
+            elif key in self.keys[key_id]:
+                scores[key_id] = max(scores.get(key_id, 0.0), INFIX_SCORE)
+        return scores
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> pd.DataFrame:
+        """Returns the top recruits for a search, best match first"""
+        if not name_key(query):
+            return self.data.iloc[0:0]
+        row_scores = {}
+        for key_id, score in self.scores(query).items():
+            for row, column in self.rows[key_id].items():
+                row_scores[row] = max((score, -column), row_scores.get(row, (0.0, 0)))
+        best = heapq.nlargest(limit, row_scores, key=lambda row: (row_scores[row], -row))
+        return self.data.iloc[best]
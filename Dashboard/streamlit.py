@@ -1,70 +1,13 @@
 """Streamlit dashboard application code"""
-from psycopg2 import connect, Error
-from psycopg2.extensions import connection
 import streamlit as st
 import pandas as pd
-import sys
-import urllib.parse as up
 from os import environ
 from dotenv import load_dotenv
+from database import get_lookups, get_recruits_page
 
 load_dotenv()
 config = environ
 
-def get_data(conn: connection) -> pd.DataFrame:
-  """Function that gets the required data from the database connection"""
-  cursor = conn.cursor()
-  cursor.execute("SELECT \
-  m.member_id, \
-  m.name AS member_name, \
-  tl.name AS team_leader_name, \
-  ra.name AS recruiting_advisor_name, \
-  r.role_name, \
-  md.purchase, \
-  cd.training_date, \
-  cd.start_date, \
-  cd.thirty_days, \
-  cd.ninety_days, \
-  cd.one_eighty_days, \
-  ms.newcomer_demo, \
-  ms.first_sale, \
-  ms.second_sale, \
-  ms.third_sale, \
-  ms.fourth_sale, \
-  ms.fifth_sale, \
-  ms.sixth_sale, \
-  ms.seventh_sale, \
-  ms.eighth_sale \
-FROM \
-  members m \
-JOIN \
-  roles r ON m.role_id_fk = r.role_id \
-LEFT JOIN \
-  member_details md ON m.member_id = md.member_id_details_fk \
-LEFT JOIN \
-  calendar_dates cd ON md.training_date_id_fk = cd.training_date_id \
-LEFT JOIN \
-  member_sales ms ON m.member_id = ms.member_id_fk \
-LEFT JOIN \
-  member_relationships mr ON m.member_id = mr.member_relationship_id_fk \
-LEFT JOIN \
-  members tl ON mr.team_leader_id = tl.member_id \
-LEFT JOIN \
-  members ra ON mr.recruiting_advisor_id = ra.member_id \
-ORDER BY team_leader_name, role_name;")
-  rows = cursor.fetchall()
-  live_dataframe = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
-  cursor.execute("SELECT * FROM calendar_dates WHERE training_date_id > 0;")
-  rows = cursor.fetchall()
-  calendar_dataframe = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
-  cursor.execute("SELECT name FROM members WHERE role_id_fk = 1;")
-  rows = cursor.fetchall()
-  team_leader_dataframe = pd.DataFrame(rows, columns=[desc[0] for desc in cursor.description])
-  cursor.close()
-  conn.close()
-  return live_dataframe, calendar_dataframe, team_leader_dataframe
-
-
 def dashboard_header() -> None:
   """Creates a header for the dashboard and title on tab."""
   st.markdown("<h1 style='text-align: center; color: white;'>New Recruits Table</h1>", unsafe_allow_html=True)
@@ -91,40 +34,57 @@ def on_toggle_or_archive_change() -> None:
   st.session_state.start_index = 0
 
 
-def create_tables(data: pd.DataFrame, cal_data: pd.DataFrame, team_leader_data: pd.DataFrame) -> None:
+def reset_page() -> None:
+  """Goes back to the first page of recruits when a filter changes."""
+  st.session_state.page_key = None
+  st.session_state.page_backwards = False
+
+
+def turn_page(key: tuple, backwards: bool) -> None:
+  """Moves to the page of recruits after, or before, the given (team leader, member id)."""
+  st.session_state.page_key = key
+  st.session_state.page_backwards = backwards
+
+
+def create_tables(cal_data: pd.DataFrame, team_leader_data: pd.DataFrame) -> None:
   """creates main table"""
+  if "page_key" not in st.session_state:
+    reset_page()
   unique_team_leaders = team_leader_data['name'].unique()
   unique_team_leaders_with_none = [None] + list(unique_team_leaders)
-  selected_leaders = st.multiselect('Select Team Leader/s', unique_team_leaders_with_none, default=unique_team_leaders_with_none)
-  filtered_df = data[data['team_leader_name'].isin(selected_leaders)]
-  st.dataframe(filtered_df, hide_index=True, use_container_width=True)
+  cal_data['start_year'] = cal_data['start_date'].dt.year
+  unique_years = cal_data['start_year'].dropna().unique()
+  leader_column, year_column, role_column = st.columns([3, 1, 1])
+  with leader_column:
+    selected_leaders = st.multiselect('Select Team Leader/s', unique_team_leaders_with_none, default=unique_team_leaders_with_none, on_change=reset_page)
+  with year_column:
+    selected_year = st.selectbox('Training Year', unique_years, index=None, placeholder="All years", on_change=reset_page)
+  with role_column:
+    selected_role = st.selectbox('Role', ["Team Leader", "Advisor"], index=None, placeholder="All roles", on_change=reset_page)
+
+  # Only the page on screen is fetched; the filters and paging run in SQL
+  page, more = get_recruits_page(tuple(selected_leaders), None if selected_year is None else int(selected_year), selected_role,
+                                 st.session_state.page_key, st.session_state.page_backwards)
+  st.dataframe(page, hide_index=True, use_container_width=True)
+
+  has_previous = more if st.session_state.page_backwards else st.session_state.page_key is not None
+  has_next = True if st.session_state.page_backwards else more
+  previous_column, next_column = st.columns(2)
+  if not page.empty:
+    first, last = page.iloc[0], page.iloc[-1]
+    with previous_column:
+      st.button("Previous", disabled=not has_previous, on_click=turn_page,
+                args=((first['team_leader_name'] if pd.notna(first['team_leader_name']) else None, int(first['member_id'])), True))
+    with next_column:
+      st.button("Next", disabled=not has_next, on_click=turn_page,
+                args=((last['team_leader_name'] if pd.notna(last['team_leader_name']) else None, int(last['member_id'])), False))
 
   st.markdown("<h1 style='text-align: center;'>Calendar Table</h1>", unsafe_allow_html=True)
-  cal_data['start_year'] = pd.to_datetime(cal_data['start_date']).dt.year
-  unique_years = cal_data['start_year'].unique()
   selected_year = st.selectbox('Select Year', unique_years)
   filtered_df = cal_data[cal_data['start_year'] == selected_year].drop(columns=['start_year', 'training_date_id'])
   st.dataframe(filtered_df, hide_index=True, use_container_width=True)
 
 
-def get_db_connection():   # pragma: no cover
-    """Establishes a connection with the PostgreSQL database."""
-    try:
-        up.uses_netloc.append("postgres")
-        url = up.urlparse(st.secrets.db_credentials.url)
-        conn = connect(database=url.path[1:],
-        user=url.username,
-        password=url.password,
-        host=url.hostname,
-        port=url.port
-        )
-        print("Database connection established successfully.")
-        return conn
-    except Error as err:
-        print("Error connecting to database: ", err)
-        sys.exit()
-
-
 if __name__ == "__main__":
 
   st.set_page_config(page_title="Recruits Tracker", layout="wide")
@@ -141,8 +101,6 @@ if __name__ == "__main__":
   dashboard_header()
   sidebar()
 
-  conn_thermomix = get_db_connection()
-
-  live_df, calendar, team_leaders = get_data(conn_thermomix)
+  calendar, team_leaders = get_lookups()
 
-  create_tables(live_df, calendar, team_leaders)
+  create_tables(calendar, team_leaders)
@@ -0,0 +1,43 @@
+"""Tests for the recruit search on the dashboard's search page"""
+import pandas as pd
+from search_index import RecruitSearchIndex
+
+RECRUITS = pd.DataFrame({
+    'member_name': ["Ava Taylor", "Mia Davies", "Olivia Ross", "Tavi Jones", "Grace Hall", "Avi Cohen"],
+    'team_leader_name': ["Judi Hampton", "Judi Hampton", "Ava Lumina", "Alina Matei", None, None],
+    'recruiting_advisor_name': [None, "Ava Taylor", None, None, "Ella Green", None]
+})
+
+
+def names(found: pd.DataFrame) -> list[str]:
+    """Lists the member names of the recruits a search found, best match first"""
+    return found['member_name'].tolist()
+
+
+def test_search_ranks_a_recruit_s_own_name_first():
+    assert names(RecruitSearchIndex(RECRUITS).search("ava")) == ["Ava Taylor", "Olivia Ross", "Mia Davies", "Avi Cohen"]
+
+
+def test_search_ranks_word_starts_over_matches_inside_a_word():
+    assert names(RecruitSearchIndex(RECRUITS).search("avi")) == ["Avi Cohen", "Mia Davies", "Tavi Jones", "Ava Taylor", "Olivia Ross"]
+
+
+def test_search_finds_misspelt_names():
+    assert names(RecruitSearchIndex(RECRUITS).search("Grace Hal"))[0] == "Grace Hall"
+    assert "Grace Hall" in names(RecruitSearchIndex(RECRUITS).search("Grase Hall"))
+
+
+def test_short_searches_match_the_start_of_a_word():
+    assert names(RecruitSearchIndex(RECRUITS).search("gr")) == ["Grace Hall"]
+    assert names(RecruitSearchIndex(RECRUITS).search("J")) == ["Tavi Jones", "Ava Taylor", "Mia Davies"]
+
+
+def test_search_ignores_case_and_accents():
+    index = RecruitSearchIndex(RECRUITS)
+    assert names(index.search("ÓLIVIA")) == names(index.search("olivia")) == ["Olivia Ross"]
+
+
+def test_empty_search_and_limit():
+    index = RecruitSearchIndex(RECRUITS)
+    assert index.search("  ").empty
+    assert len(index.search("a", limit=2)) == 2
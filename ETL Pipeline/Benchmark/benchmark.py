@@ -0,0 +1,119 @@
+"""Benchmarks the transform and load stages against synthetic workbooks and a throwaway PostgreSQL.
+
+Run from the ETL Pipeline folder with `python3 -m Benchmark.benchmark`. Set BENCHMARK_DATABASE_URL
+to use an existing scratch database, otherwise a temporary cluster is started with initdb."""
+from contextlib import contextmanager
+from datetime import datetime
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from Benchmark.generate_workbooks import generate_workbooks
+from Transform.cleaning import clean_recruits
+from Transform.transform import discover_workbooks, iter_recruits_chunks, list_recruits_sheets, read_recruits_sheet, read_training_dates, year_from_name
+from Load.calendar_dates import generate_calendar
+from Load.load import create_tables, get_db_connection, populate_database, incremental_populate_database, stream_populate_database
+from run_report import InstrumentedConnection, stage
+
+LOAD_MODES = ["rows", "bulk", "incremental", "stream"]
+
+
+@contextmanager
+def throwaway_postgres():
+    """Yields a database URL, starting a temporary PostgreSQL cluster unless one is configured"""
+    if os.environ.get("BENCHMARK_DATABASE_URL"):
+        yield os.environ["BENCHMARK_DATABASE_URL"]
+        return
+    if not shutil.which("initdb") or not shutil.which("pg_ctl"):
+        raise RuntimeError("Set BENCHMARK_DATABASE_URL or put initdb and pg_ctl on the PATH.")
+    data_dir = tempfile.mkdtemp(prefix="recruits-bench-pg-")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    subprocess.run(["initdb", "-D", data_dir, "-U", "bench", "--auth=trust"], check=True, capture_output=True)
+    subprocess.run(["pg_ctl", "-D", data_dir, "-o", f"-p {port} -k {data_dir}", "-w", "start"],
+                   check=True, capture_output=True)
+    try:
+        yield f"postgres://bench@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "stop"], capture_output=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextmanager
+def measure(results: list, name: str, rows: int, **details):
+    """Records wall time, throughput, peak Python memory and SQL counts for a stage"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with stage(f"benchmark.{name}", rows_in=rows) as record:
+        yield record
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.append({**details, "stage": name, "rows": rows, "seconds": round(seconds, 4),
+                    "rows_per_second": round(rows / seconds, 1) if seconds else None,
+                    "peak_memory_mb": round(peak / 2 ** 20, 2),
+                    "statements": record["statements"], "round_trips": record["round_trips"]})
+    print(f"{name:<24}{rows:>8} rows {seconds:>9.3f}s {results[-1]['rows_per_second']:>12} rows/s "
+          f"{results[-1]['peak_memory_mb']:>9} MB")
+
+
+def current_commit() -> str:
+    """Returns the commit being benchmarked so results can be compared across commits"""
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def run_benchmark(sizes: list[int], modes: list[str], database_url: str, output: str) -> list[dict]:
+    """Times transform and every load mode at each size, appending the results to a JSON lines file"""
+    os.environ["DATABASE_URL"] = database_url
+    details = {"commit": current_commit(), "run_at": datetime.now().isoformat()}
+    results = []
+    for size in sizes:
+        folder = tempfile.mkdtemp(prefix=f"recruits-bench-{size}-")
+        try:
+            generate_workbooks(folder, size)
+            recruits_paths, training_dates_paths = discover_workbooks(folder)
+            sheet_name = list_recruits_sheets(recruits_paths[0])[0]
+            year = year_from_name(sheet_name)
+
+            with measure(results, "transform.parse", size, recruits=size, **details):
+                recruits_df = read_recruits_sheet(recruits_paths[0], sheet_name)
+                calendar_df = generate_calendar(year, overrides=read_training_dates(training_dates_paths[0]))
+            with measure(results, "transform.clean", size, recruits=size, **details):
+                df = clean_recruits(recruits_df)
+
+            for mode in modes:
+                conn = get_db_connection(connection_factory=InstrumentedConnection)
+                create_tables(conn)
+                with measure(results, f"load.{mode}", size, recruits=size, **details):
+                    if mode == "incremental":
+                        incremental_populate_database(conn, df, calendar_df, year)
+                    elif mode == "stream":
+                        stream_populate_database(conn, iter_recruits_chunks(recruits_paths[0], sheet_name), calendar_df, year)
+                    else:
+                        populate_database(conn, df, calendar_df, year, bulk=mode == "bulk")
+                conn.close()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    with open(output, "a") as output_file:
+        for result in results:
+            output_file.write(json.dumps(result) + "\n")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the recruits ETL pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--modes", nargs="+", choices=LOAD_MODES, default=LOAD_MODES)
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    args = parser.parse_args()
+
+    with throwaway_postgres() as url:
+        run_benchmark(args.sizes, args.modes, url, args.output)
@@ -0,0 +1,92 @@
+"""This module contains functions used to generate synthetic recruits and training dates workbooks."""
+from datetime import datetime, timedelta
+import argparse
+import calendar
+import os
+import random
+import openpyxl
+
+TEAM_LEADERS = ["Miranda Quantrill", "Ana Maria Lumina", "Judi Hampton",
+                "Malgorzata Strzelecka", "Alina Matei", "Sara Joiner-Jarrett"]
+FIRST_NAMES = ["Amelia", "Olivia", "Isla", "Ava", "Mia", "Grace", "Sophia", "Lily", "Freya", "Emily",
+               "Ivy", "Ella", "Rosie", "Evie", "Florence", "Poppy", "Charlotte", "Willow", "Ioana", "Maria"]
+LAST_NAMES = ["Smith", "Jones", "Taylor", "Brown", "Williams", "Wilson", "Johnson", "Davies", "Patel",
+              "Wright", "Popescu", "Kowalska", "Evans", "Thomas", "Roberts", "Walker", "Green", "Hall"]
+RECRUITS_HEADER = ["Advisor name", "Purchase", "Team Leader", "Recruiting Advisor", "Training Date",
+                   "Start Date", "30 Days", "90 Days", "180 Days", "Newcomer demo",
+                   "1st Sale", "2nd Sale", "3rd Sale", "4th Sale", "5th Sale", "6th Sale", "7th Sale", "8th Sale"]
+
+
+def training_label(month: int) -> str:
+    """Names a monthly training date the way the recruits sheet does"""
+    return calendar.month_name[month]
+
+
+def recruit_rows(count: int, year: int, rng: random.Random):
+    """Yields realistic recruits rows for a year"""
+    names = []
+    for index in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index:06d}"
+        month = rng.randint(1, 12)
+        start = datetime(year, month, 1) + timedelta(days=rng.randint(0, 27))
+        recruiting_advisor = rng.choice(names) if names and rng.random() < 0.6 else None
+        newcomer_demo = start + timedelta(days=rng.randint(3, 20)) if rng.random() < 0.8 else None
+        sales, sale_date = [], start
+        for _ in range(8):
+            roll = rng.random()
+            if roll < 0.55:
+                sale_date = sale_date + timedelta(days=rng.randint(5, 40))
+                sales.append(sale_date)
+            elif roll < 0.65:
+                sales.append("DNQ")
+            else:
+                sales.append(None)
+        names.append(name)
+        yield [name, rng.choice(["Owner", "Earner"]), rng.choice(TEAM_LEADERS), recruiting_advisor,
+               training_label(month), start, start + timedelta(days=30), start + timedelta(days=90),
+               start + timedelta(days=180), newcomer_demo] + sales
+
+
+def write_recruits_workbook(path: str, count: int, year: int = 2024, seed: int = 0) -> None:
+    """Writes a 'Recruits Tracker' workbook with a header, a sub-header row and count recruits"""
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(f"Recruits Tracker{str(year)[-2:]}")
+    sheet.append(RECRUITS_HEADER)
+    sheet.append(["Name", "Owner/Earner", None, None, "Month", "Date"] + [None] * 12)
+    for row in recruit_rows(count, year, rng):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def write_training_dates_workbook(path: str, year: int = 2024) -> None:
+    """Writes a training and reporting dates workbook laid out like the real one"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Dates")
+    sheet.append([f"TRAINING AND REPORTING DATES {year}"])
+    sheet.append([])
+    sheet.append([])
+    sheet.append(["Training", "Location", "Trainer", "Start Date", "30 Days", "90 Days"])
+    for month in range(1, 13):
+        start = datetime(year, month, 1)
+        sheet.append([f"{training_label(month).upper()} {year}", "Online", None,
+                      start, start + timedelta(days=30), start + timedelta(days=90)])
+    sheet.append(["Dates subject to change"])
+    workbook.save(path)
+
+
+def generate_workbooks(folder: str, count: int, year: int = 2024, seed: int = 0) -> None:
+    """Writes a recruits workbook and its training dates workbook into a folder"""
+    os.makedirs(folder, exist_ok=True)
+    write_recruits_workbook(f"{folder}/Recruits Tracker {year}.xlsx", count, year, seed)
+    write_training_dates_workbook(f"{folder}/TRAINING AND REPORTING DATES {year}.xlsx", year)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic recruits workbooks")
+    parser.add_argument("folder")
+    parser.add_argument("--recruits", type=int, default=1000)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_workbooks(args.folder, args.recruits, args.year, args.seed)
@@ -0,0 +1,48 @@
+"""This module contains functions used to build and load the training calendar."""
+from psycopg2.extensions import connection
+import psycopg2.extras
+import pandas as pd
+from Transform.cleaning import ONE_EIGHTY_DAYS_AFTER_NINETY
+
+CALENDAR_COLUMNS = ['training_date', 'start_date', 'thirty_days', 'ninety_days', 'one_eighty_days']
+
+# Training starts on the first Monday of every month; milestones count on from the start date
+TRAINING_WEEKDAY = 0
+TRAINING_OCCURRENCE = 1
+MILESTONE_DAYS = {'thirty_days': 30, 'ninety_days': 90}
+
+
+def generate_calendar(first_year: int, last_year: int = None, overrides: pd.DataFrame = None,
+                      weekday: int = TRAINING_WEEKDAY, occurrence: int = TRAINING_OCCURRENCE) -> pd.DataFrame:
+    """Builds the monthly training calendar for a range of years from the cadence rules.
+    Rows in overrides (e.g. from stage_training_dates) replace the generated row for their month."""
+    month_starts = pd.date_range(f"{first_year}-01-01", f"{last_year or first_year}-12-01", freq="MS")
+    offsets = (weekday - month_starts.weekday) % 7 + 7 * (occurrence - 1)
+    start_dates = month_starts + pd.to_timedelta(offsets, unit="D")
+    calendar_df = pd.DataFrame({
+        'training_date': month_starts.strftime('%B %Y').str.upper(),
+        'start_date': start_dates
+    })
+    for column, days in MILESTONE_DAYS.items():
+        calendar_df[column] = calendar_df['start_date'] + pd.Timedelta(days=days)
+    calendar_df['one_eighty_days'] = calendar_df['ninety_days'] + pd.Timedelta(days=ONE_EIGHTY_DAYS_AFTER_NINETY)
+
+    if overrides is not None and not overrides.empty:
+        overridden_months = overrides['start_date'].dt.to_period('M').dropna().unique()
+        calendar_df = calendar_df[~calendar_df['start_date'].dt.to_period('M').isin(overridden_months)]
+        calendar_df = pd.concat([calendar_df, overrides[CALENDAR_COLUMNS]])
+    return calendar_df.sort_values('start_date').reset_index(drop=True)
+
+
+def load_calendar(conn_current: connection, calendar_df: pd.DataFrame) -> int:
+    """Inserts the calendar in one batched statement, skipping rows already loaded"""
+    rows = calendar_df[CALENDAR_COLUMNS].astype(object).where(calendar_df[CALENDAR_COLUMNS].notna(), None)
+    cur = conn_current.cursor()
+    psycopg2.extras.execute_values(
+        cur,
+        'INSERT INTO calendar_dates(training_date, start_date, thirty_days, ninety_days, one_eighty_days) VALUES %s ON CONFLICT DO NOTHING',
+        list(rows.itertuples(index=False, name=None)),
+        page_size=max(len(rows), 1))
+    cur.close()
+    conn_current.commit()
+    return len(rows)
@@ -2,12 +2,21 @@
 from psycopg2 import connect, extensions, Error
 from psycopg2.extensions import connection
 import psycopg2.extras
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 import pandas as pd
-from datetime import datetime, timedelta
+import io
+import json
+from datetime import datetime
+from typing import Iterable
 import sys
 import urllib.parse as up
 from os import environ
 from dotenv import load_dotenv
+from run_report import stage
+from Load.calendar_dates import generate_calendar, load_calendar
+from Load.name_matching import NameMatcher, name_key
+from Transform.cleaning import SALE_COLUMNS, clean_recruits, stage_training_dates
 
 
 load_dotenv()
@@ -39,95 +48,599 @@ def create_tables(conn_database: connection):
     conn_database.commit()
 
 
-def populate_database(conn_current: connection):
-    """Populates the database"""
-    recruit2023_df = pd.read_csv(f"ExcelSheets/2023Recruits.csv", index_col=False)
-    recruit2024_df = pd.read_csv(f"ExcelSheets/2024Recruits.csv", index_col=False)
-    df = pd.concat([recruit2024_df[1:]])
-    df = df.dropna(subset=['Advisor name'])
-    date_columns = ['Start Date', 'Newcomer demo']
-    df[date_columns] = df[date_columns].applymap(lambda x: pd.to_datetime(x, errors='coerce').strftime('%Y-%m-%d') if pd.notna(x) else x)
-    
-    dates_df = pd.read_excel(f"ExcelSheets/TRAINING AND REPORTING DATES 2024.xlsx", index_col=False, skiprows=3)[:-1]
+STAGING_TABLES_SQL = """
+CREATE TEMP TABLE stage_calendar (
+  training_date TEXT,
+  start_date DATE,
+  thirty_days DATE,
+  ninety_days DATE,
+  one_eighty_days DATE
+) ON COMMIT DROP;
 
-    team_leaders = {"Miranda Quantrill","Ana Maria Lumina","Judi Hampton","Malgorzata Strzelecka","Alina Matei","Sara Joiner-Jarrett"}
+CREATE TEMP TABLE stage_recruits (
+  name TEXT,
+  role_id INTEGER,
+  purchase TEXT,
+  team_leader TEXT,
+  recruiting_advisor TEXT,
+  training_date TEXT,
+  newcomer_demo DATE,
+  first_sale VARCHAR(20),
+  second_sale VARCHAR(20),
+  third_sale VARCHAR(20),
+  fourth_sale VARCHAR(20),
+  fifth_sale VARCHAR(20),
+  sixth_sale VARCHAR(20),
+  seventh_sale VARCHAR(20),
+  eighth_sale VARCHAR(20),
+  source_year INTEGER,
+  recruit_key TEXT,
+  row_hash TEXT
+) ON COMMIT DROP;
 
-    cur = conn_current.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    for index, row in dates_df.iterrows():
-        cur.execute(f'INSERT INTO calendar_dates(training_date, start_date, thirty_days, ninety_days, one_eighty_days) VALUES \
-                (%s,%s,%s,%s,%s) ON CONFLICT DO NOTHING', (row[0], row[3], row[4], row[5], row[5] + timedelta(days=90)))
+CREATE TEMP TABLE stage_links (
+  name TEXT,
+  member_id INTEGER
+) ON COMMIT DROP;
+
+CREATE TEMP TABLE stage_date_links (
+  training_date TEXT,
+  training_date_id INTEGER
+) ON COMMIT DROP;
+"""
+
+CALENDAR_INSERT_SQL = """
+INSERT INTO calendar_dates(training_date, start_date, thirty_days, ninety_days, one_eighty_days)
+SELECT training_date, start_date, thirty_days, ninety_days, one_eighty_days
+FROM stage_calendar
+ON CONFLICT DO NOTHING;
+"""
+
+CALENDAR_UPSERT_SQL = """
+INSERT INTO calendar_dates(training_date, start_date, thirty_days, ninety_days, one_eighty_days)
+SELECT training_date, start_date, thirty_days, ninety_days, one_eighty_days
+FROM stage_calendar
+ON CONFLICT (training_date, start_date) DO UPDATE
+SET thirty_days = EXCLUDED.thirty_days, ninety_days = EXCLUDED.ninety_days, one_eighty_days = EXCLUDED.one_eighty_days
+WHERE (calendar_dates.thirty_days, calendar_dates.ninety_days, calendar_dates.one_eighty_days)
+IS DISTINCT FROM (EXCLUDED.thirty_days, EXCLUDED.ninety_days, EXCLUDED.one_eighty_days);
+"""
+
+# Recruits are matched to members by name_key in Python, as in rows mode, and only the new ones inserted
+# Training date labels are likewise resolved in Python and joined through stage_date_links
+MEMBERS_INSERT_SQL = "INSERT INTO members(name, role_id_fk) VALUES %s RETURNING member_id, name"
+
+RESOLVE_SQL = """
+CREATE TEMP TABLE stage_resolved ON COMMIT DROP AS
+SELECT rec.member_id, s.*, COALESCE(td.training_date_id, 0) AS training_date_id,
+       tl.member_id AS team_leader_id, ra.member_id AS recruiting_advisor_id
+FROM stage_recruits s
+JOIN stage_links rec ON rec.name = s.name
+LEFT JOIN stage_date_links td ON td.training_date = s.training_date
+LEFT JOIN stage_links tl ON tl.name = s.team_leader
+LEFT JOIN stage_links ra ON ra.name = s.recruiting_advisor;
+
+-- Unpivots the sale columns into one row per recorded sale
+CREATE TEMP TABLE stage_sale_events ON COMMIT DROP AS
+SELECT DISTINCT ON (r.member_id, sales.sale_number) r.member_id, sales.sale_number,
+       CASE WHEN sales.sale = 'DNQ' THEN NULL ELSE sales.sale::date END AS sale_date,
+       CASE WHEN sales.sale = 'DNQ' THEN 'DNQ' ELSE 'SALE' END AS status
+FROM stage_resolved r
+CROSS JOIN LATERAL (VALUES (1, r.first_sale), (2, r.second_sale), (3, r.third_sale), (4, r.fourth_sale),
+                           (5, r.fifth_sale), (6, r.sixth_sale), (7, r.seventh_sale), (8, r.eighth_sale)
+) AS sales(sale_number, sale)
+WHERE sales.sale IS NOT NULL
+ORDER BY r.member_id, sales.sale_number;
+"""
+
+# Facts are upserted in every mode, so a recruit listed twice (later in the sheet, in a later chunk or in a
+# later year's sheet) ends up with the details of its last row, matching the row_hash kept in recruit_sources
+FACTS_UPSERT_SQL = """
+INSERT INTO member_details(member_id_details_fk, purchase, training_date_id_fk)
+SELECT member_id, purchase, training_date_id FROM stage_resolved
+ON CONFLICT (member_id_details_fk) DO UPDATE
+SET purchase = EXCLUDED.purchase, training_date_id_fk = EXCLUDED.training_date_id_fk;
+
+INSERT INTO member_newcomer_demos(member_id_fk, newcomer_demo)
+SELECT member_id, newcomer_demo FROM stage_resolved
+ON CONFLICT (member_id_fk) DO UPDATE
+SET newcomer_demo = EXCLUDED.newcomer_demo;
+
+DELETE FROM member_sale_events WHERE member_id_fk IN (SELECT member_id FROM stage_resolved);
+
+INSERT INTO member_sale_events(member_id_fk, sale_number, sale_date, status)
+SELECT member_id, sale_number, sale_date, status FROM stage_sale_events;
+
+INSERT INTO member_relationships(member_relationship_id_fk, team_leader_id, recruiting_advisor_id)
+SELECT member_id, team_leader_id, recruiting_advisor_id FROM stage_resolved
+ON CONFLICT (member_relationship_id_fk) DO UPDATE
+SET team_leader_id = EXCLUDED.team_leader_id, recruiting_advisor_id = EXCLUDED.recruiting_advisor_id;
+"""
+
+SOURCES_UPSERT_SQL = """
+INSERT INTO recruit_sources(source_year, recruit_key, member_id_fk, row_hash)
+SELECT source_year, recruit_key, member_id, row_hash FROM stage_resolved
+ON CONFLICT (source_year, recruit_key) DO UPDATE
+SET member_id_fk = EXCLUDED.member_id_fk, row_hash = EXCLUDED.row_hash, loaded_at = NOW();
+"""
+
+# Rows mode records its fingerprints row by row rather than from stage_resolved
+SOURCES_VALUES_UPSERT_SQL = """
+INSERT INTO recruit_sources(source_year, recruit_key, member_id_fk, row_hash) VALUES %s
+ON CONFLICT (source_year, recruit_key) DO UPDATE
+SET member_id_fk = EXCLUDED.member_id_fk, row_hash = EXCLUDED.row_hash, loaded_at = NOW();
+"""
+
+QUARANTINE_SQL = """
+INSERT INTO quarantined_recruits(source_year, recruit_key, name, reason, source_row) VALUES %s
+ON CONFLICT (source_year, recruit_key) DO UPDATE
+SET name = EXCLUDED.name, reason = EXCLUDED.reason, source_row = EXCLUDED.source_row, quarantined_at = NOW();
+"""
+
+REMOVE_RECRUITS_SQL = """
+CREATE TEMP TABLE removed_members ON COMMIT DROP AS
+SELECT member_id_fk AS member_id FROM recruit_sources
+WHERE source_year = %(year)s AND recruit_key = ANY(%(keys)s);
+
+DELETE FROM recruit_sources WHERE source_year = %(year)s AND recruit_key = ANY(%(keys)s);
+
+-- Members still listed in another year's sheet keep their rows
+DELETE FROM removed_members r
+WHERE EXISTS (SELECT 1 FROM recruit_sources rs WHERE rs.member_id_fk = r.member_id);
+
+DELETE FROM member_details WHERE member_id_details_fk IN (SELECT member_id FROM removed_members);
+DELETE FROM member_newcomer_demos WHERE member_id_fk IN (SELECT member_id FROM removed_members);
+DELETE FROM member_sale_events WHERE member_id_fk IN (SELECT member_id FROM removed_members);
+DELETE FROM member_relationships WHERE member_relationship_id_fk IN (SELECT member_id FROM removed_members);
+
+DELETE FROM members m
+WHERE m.member_id IN (SELECT member_id FROM removed_members)
+AND NOT EXISTS (SELECT 1 FROM member_relationships r
+                WHERE r.team_leader_id = m.member_id OR r.recruiting_advisor_id = m.member_id);
+"""
+
+CHECKPOINT_UPSERT_SQL = """
+INSERT INTO load_checkpoints(source_year, source_hash, batch_size, last_batch, completed)
+VALUES (%(year)s, %(source_hash)s, %(batch_size)s, %(last_batch)s, %(completed)s)
+ON CONFLICT (source_year) DO UPDATE
+SET source_hash = EXCLUDED.source_hash, batch_size = EXCLUDED.batch_size, last_batch = EXCLUDED.last_batch,
+    completed = EXCLUDED.completed, updated_at = NOW();
+"""
+
+# Statements run once per row or per new member, prepared once per connection and run with EXECUTE
+# so the server parses and plans them a single time however many rows are loaded
+PREPARED_STATEMENTS = {
+    "insert_member": "INSERT INTO members(name, role_id_fk) VALUES ($1, $2) RETURNING member_id",
+    "upsert_member_details": """INSERT INTO member_details(member_id_details_fk, purchase, training_date_id_fk)
+                                VALUES ($1, $2, $3) ON CONFLICT (member_id_details_fk) DO UPDATE
+                                SET purchase = EXCLUDED.purchase, training_date_id_fk = EXCLUDED.training_date_id_fk""",
+    "upsert_newcomer_demo": """INSERT INTO member_newcomer_demos(member_id_fk, newcomer_demo)
+                               VALUES ($1, $2) ON CONFLICT (member_id_fk) DO UPDATE SET newcomer_demo = EXCLUDED.newcomer_demo""",
+    "delete_sale_events": "DELETE FROM member_sale_events WHERE member_id_fk = $1",
+    "upsert_relationship": """INSERT INTO member_relationships(member_relationship_id_fk, team_leader_id, recruiting_advisor_id)
+                              VALUES ($1, $2, $3) ON CONFLICT (member_relationship_id_fk) DO UPDATE
+                              SET team_leader_id = EXCLUDED.team_leader_id, recruiting_advisor_id = EXCLUDED.recruiting_advisor_id"""
+}
+
+# Rebuilds the dashboard's read model; CONCURRENTLY keeps it readable while the new rows are computed
+REFRESH_OVERVIEW_SQL = "REFRESH MATERIALIZED VIEW CONCURRENTLY recruits_overview;"
+
+# Loads running side by side take this before matching names, so each one sees the members the
+# others created; it is held until the load commits
+LOCK_MEMBERS_SQL = "SELECT pg_advisory_xact_lock(hashtext('members'));"
+
+
+def prepare_statements(conn_current: connection) -> None:
+    """Prepares the statements in PREPARED_STATEMENTS that the connection has not prepared yet.
+    Prepared statements last as long as the connection, so a pooled connection prepares them once."""
+    cur = conn_current.cursor()
+    cur.execute("SELECT name FROM pg_prepared_statements;")
+    prepared = {name for name, in cur.fetchall()}
+    for name, sql in PREPARED_STATEMENTS.items():
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {sql};")
     cur.close()
-    conn_current.commit()
 
+
+def lock_members(cur, wait_turn=None) -> None:
+    """Takes the members lock, first calling wait_turn if given (e.g. to let earlier years go first)"""
+    if wait_turn is not None:
+        wait_turn()
+    cur.execute(LOCK_MEMBERS_SQL)
+
+
+def known_training_dates(conn_current: connection, year: int, calendar_df: pd.DataFrame = None) -> set:
+    """Returns the normalised labels of the year's training dates already in the database or about to be loaded.
+    Only that year's calendar counts, as recruits resolve their training date within their own year."""
+    cur = conn_current.cursor()
+    cur.execute("SELECT training_date FROM calendar_dates WHERE training_date IS NOT NULL AND EXTRACT(YEAR FROM start_date) = %s;",
+                (year,))
+    labels = {normalise_training_date(training_date) for training_date, in cur.fetchall()}
+    cur.close()
+    if calendar_df is not None:
+        this_year = calendar_df[calendar_df['start_date'].dt.year == year]
+        labels.update(this_year['training_date'].dropna().map(normalise_training_date))
+    return labels
+
+
+def validate_recruits(df: pd.DataFrame, training_dates: set) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Splits cleaned recruits into the rows that can be loaded and the rejected rows, with a reason column
+    joining the problems clean_recruits found in their cells and a training date missing from the year's calendar"""
+    # Training dates resolve like the loader does, to the first calendar label containing them
+    labels = df['training_date'].dropna().map(normalise_training_date)
+    known = {label: any(label in training_date for training_date in training_dates) for label in labels.unique()}
+    unknown = labels.map(known).reindex(df.index).eq(False)
+    unknown_reasons = "unknown training_date: " + df.loc[unknown, 'training_date'].astype(str).map(repr)
+
+    reasons = pd.concat([df['problems'].dropna(), unknown_reasons]).groupby(level=0, sort=False).agg("; ".join)
+    invalid = df.index.isin(reasons.index)
+    df = df.drop(columns='problems')
+    return df[~invalid], df[invalid].assign(reason=reasons)
+
+
+def quarantine_recruits(conn_current: connection, rejected: pd.DataFrame, year: int) -> int:
+    """Records rejected recruits, their source values and the reason in quarantined_recruits.
+    Nothing is committed, so the quarantine lands in the same transaction as the load."""
+    rejected = rejected.assign(recruit_key=rejected['name'].map(name_key)).drop_duplicates('recruit_key', keep='last')
+    source_rows = json.loads(rejected.drop(columns=['reason', 'recruit_key']).to_json(orient='records', date_format='iso'))
+    cur = conn_current.cursor()
+    psycopg2.extras.execute_values(cur, QUARANTINE_SQL, [
+        (year, recruit_key, name, reason, psycopg2.extras.Json(source_row))
+        for recruit_key, name, reason, source_row in zip(rejected['recruit_key'], rejected['name'], rejected['reason'], source_rows)])
+    cur.close()
+    return len(rejected)
+
+
+def screen_recruits(conn_current: connection, df: pd.DataFrame, training_dates: set, year: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Runs the validation stage between cleaning and loading, quarantining the rows that fail"""
+    with stage(f"load.{year}.validate", rows_in=len(df)) as record:
+        valid, rejected = validate_recruits(df, training_dates)
+        if not rejected.empty:
+            quarantine_recruits(conn_current, rejected, year)
+            print(f"Quarantined {len(rejected)} recruits from {year}, see the quarantined_recruits table.")
+        record["rows_out"] = len(valid)
+    return valid, rejected
+
+
+def fingerprint_recruits(staged: pd.DataFrame, year: int) -> pd.DataFrame:
+    """Adds the source year, a natural key and a content hash to each staged recruit,
+    keeping the last row when a recruit appears more than once"""
+    hashes = pd.util.hash_pandas_object(staged.astype(str), index=False)
+    staged = staged.assign(source_year=year, recruit_key=staged['name'].map(name_key),
+                           row_hash=hashes.map('{:016x}'.format))
+    return staged.drop_duplicates(subset='recruit_key', keep='last')
+
+
+def copy_dataframe(cur, df: pd.DataFrame, table: str):
+    """Streams a dataframe into a table with a single COPY"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def member_matcher(conn_current: connection) -> NameMatcher:
+    """Builds a name matcher over every member in the database"""
+    cur = conn_current.cursor()
+    cur.execute("SELECT member_id, name FROM members WHERE name IS NOT NULL;")
+    matcher = NameMatcher(cur.fetchall())
+    cur.close()
+    return matcher
+
+
+def insert_members(cur, df: pd.DataFrame, matcher: NameMatcher, year: int) -> None:
+    """Resolves the staged recruits to members by name_key, inserting the new ones in one statement,
+    then resolves the team leader and recruiting advisor names with the matcher, inserting advisors
+    that match no member. The links are copied into stage_links for RESOLVE_SQL and ambiguous names are reported."""
+    recruits = df.drop_duplicates('name')
+    new_members = recruits[recruits['name'].map(matcher.exact).isna()]
+    new_members = new_members[~new_members['name'].map(name_key).duplicated()]
+    if not new_members.empty:
+        for member_id, name in psycopg2.extras.execute_values(
+                cur, MEMBERS_INSERT_SQL, list(zip(new_members['name'].tolist(), new_members['role_id'].tolist())),
+                page_size=len(new_members), fetch=True):
+            matcher.add(member_id, name)
+
+    with stage(f"load.{year}.match", rows_in=len(df)) as record:
+        links = {name: matcher.exact(name) for name in recruits['name']}
+        for name in df['recruiting_advisor'].dropna().unique():
+            links[name] = matcher.match(name)
+            if links[name] is None:
+                cur.execute("EXECUTE insert_member(%s, 2);", (name,))
+                links[name] = cur.fetchone()[0]
+                matcher.add(links[name], name)
+        for name in df['team_leader'].dropna().unique():
+            if name not in links:
+                links[name] = matcher.match(name)
+        copy_dataframe(cur, pd.DataFrame({'name': list(links), 'member_id': pd.array(list(links.values()), dtype='Int64')}),
+                       "stage_links")
+
+        record["rows_out"] = len(links)
+        report_ambiguous(matcher, year, record)
+
+
+def report_ambiguous(matcher: NameMatcher, year: int, record: dict) -> None:
+    """Prints the names the matcher found ambiguous, adds them to a stage record and forgets them"""
+    record["ambiguous_names"] = dict(matcher.ambiguous)
+    for name, candidates in matcher.ambiguous.items():
+        print(f"Ambiguous name '{name}' in {year}: matched '{candidates[0]}', also close to {candidates[1:]}.")
+    matcher.ambiguous.clear()
+
+
+def bulk_populate_database(conn_current: connection, df: pd.DataFrame, calendar_df: pd.DataFrame, year: int,
+                           wait_turn=None):
+    """Populates the database with set-based statements from COPY-filled staging tables"""
+    df, rejected = screen_recruits(conn_current, df, known_training_dates(conn_current, year, calendar_df), year)
+    prepare_statements(conn_current)
+
+    cur = conn_current.cursor()
+    with stage(f"load.{year}.copy", rows_in=len(df)):
+        cur.execute(STAGING_TABLES_SQL)
+        if calendar_df is not None:
+            copy_dataframe(cur, calendar_df, "stage_calendar")
+        staged = fingerprint_recruits(df, year)
+        copy_dataframe(cur, staged, "stage_recruits")
+    with stage(f"load.{year}.insert", rows_in=len(df)) as record:
+        # Calendars of different years can share rows, so a year waits for its turn before writing any,
+        # rather than holding uncommitted rows an earlier year would block on while it waits in Python
+        lock_members(cur, wait_turn)
+        cur.execute(CALENDAR_INSERT_SQL)
+        insert_members(cur, staged, member_matcher(conn_current), year)
+        link_training_dates(cur, staged, training_date_resolver(cur, year))
+        cur.execute(RESOLVE_SQL + FACTS_UPSERT_SQL + SOURCES_UPSERT_SQL)
+        cur.close()
+        conn_current.commit()
+        record["rows_out"] = len(df)
+    return len(df)
+
+
+def refresh_recruits_overview(conn_current: connection) -> None:
+    """Refreshes the recruits_overview materialized view the dashboard reads, once the loads have committed"""
+    with stage("load.refresh_overview"):
+        cur = conn_current.cursor()
+        cur.execute(REFRESH_OVERVIEW_SQL)
+        cur.close()
+        conn_current.commit()
+
+
+def read_load_checkpoint(conn_current: connection, year: int) -> dict:
+    """Returns the checkpoint of a year's last streamed load, or None if it has none"""
     cur = conn_current.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("SELECT source_hash, batch_size, last_batch, completed FROM load_checkpoints WHERE source_year = %s;", (year,))
+    checkpoint = cur.fetchone()
+    cur.close()
+    return checkpoint
 
-    for index, row in df.iterrows():
-        if row[0] in team_leaders:
-            role = 1
-        else:
-            role = 2
 
-        select_query = "SELECT training_date_id FROM calendar_dates WHERE training_date LIKE %s;"
-        cur.execute(select_query, ("%" + row[4].upper().rstrip() + "%",))
-        result = cur.fetchone()
+def stream_populate_database(conn_current: connection, chunks: Iterable[pd.DataFrame], calendar_df: pd.DataFrame, year: int,
+                             source_hash: str = None, batch_size: int = None, first_chunk: int = 0):
+    """Loads a year from an iterable of recruits chunks (e.g. iter_recruits_chunks) as a generator
+    pipeline. Each chunk is cleaned, staged and inserted in its own transaction, so memory is
+    bounded by the chunk size rather than the size of the sheet. Given a source_hash, every
+    transaction also records its batch in load_checkpoints, and first_chunk resumes after the
+    last committed batch."""
+    if calendar_df is not None:
+        with stage(f"load.{year}.calendar", rows_in=len(calendar_df)) as record:
+            record["rows_out"] = load_calendar(conn_current, calendar_df)
+
+    checkpoint = {"year": year, "source_hash": source_hash, "batch_size": batch_size}
+    prepare_statements(conn_current)
+    training_dates = known_training_dates(conn_current, year, calendar_df)
+    matcher = member_matcher(conn_current)
+    cur = conn_current.cursor()
+    training_date_ids = training_date_resolver(cur, year)
+    cur.close()
+    cleaned = (clean_recruits(chunk, sub_header=number == 0) for number, chunk in enumerate(chunks, start=first_chunk))
+    validated = (screen_recruits(conn_current, df, training_dates, year)[0] for df in cleaned)
+    staged = (fingerprint_recruits(df, year) for df in validated)
+    loaded, last_batch = 0, first_chunk - 1
+    for number, df in enumerate(staged, start=first_chunk):
+        with stage(f"load.{year}.chunk.{number}", rows_in=len(df)) as record:
+            cur = conn_current.cursor()
+            cur.execute(STAGING_TABLES_SQL)
+            copy_dataframe(cur, df, "stage_recruits")
+            insert_members(cur, df, matcher, year)
+            link_training_dates(cur, df, training_date_ids)
+            cur.execute(RESOLVE_SQL + FACTS_UPSERT_SQL + SOURCES_UPSERT_SQL)
+            if source_hash is not None:
+                cur.execute(CHECKPOINT_UPSERT_SQL, {**checkpoint, "last_batch": number, "completed": False})
+            cur.close()
+            conn_current.commit()
+            record["rows_out"] = len(df)
+        loaded, last_batch = loaded + len(df), number
+
+    if source_hash is not None:
+        cur = conn_current.cursor()
+        cur.execute(CHECKPOINT_UPSERT_SQL, {**checkpoint, "last_batch": last_batch, "completed": True})
+        cur.close()
+        conn_current.commit()
+    return loaded
+
+
+def incremental_populate_database(conn_current: connection, df: pd.DataFrame, calendar_df: pd.DataFrame, year: int,
+                                  wait_turn=None):
+    """Upserts only new or changed recruits of a year and deletes removed ones, in one
+    transaction so readers never see a partially loaded database. df is the year's recruits from clean_recruits."""
+    df, rejected = screen_recruits(conn_current, df, known_training_dates(conn_current, year, calendar_df), year)
+    staged = fingerprint_recruits(df, year)
+    prepare_statements(conn_current)
+
+    cur = conn_current.cursor()
+    with stage(f"load.{year}.diff", rows_in=len(staged)) as record:
+        cur.execute("SELECT recruit_key, row_hash FROM recruit_sources WHERE source_year = %s;", (year,))
+        loaded_hashes = dict(cur.fetchall())
+        changed = staged[staged['row_hash'] != staged['recruit_key'].map(loaded_hashes)]
+        # An empty sheet is far more likely to be a bad export than a real wipe
+        # Quarantined recruits keep their last good load rather than being deleted
+        quarantined = sorted(set(rejected['name'].map(name_key)))
+        removed = sorted(set(loaded_hashes) - set(staged['recruit_key']) - set(quarantined)) if not staged.empty else []
+        record["rows_out"] = len(changed) + len(removed)
+
+    with stage(f"load.{year}.apply", rows_in=len(changed) + len(removed)):
+        cur.execute(STAGING_TABLES_SQL)
+        if calendar_df is not None:
+            copy_dataframe(cur, calendar_df, "stage_calendar")
+        copy_dataframe(cur, changed, "stage_recruits")
+        lock_members(cur, wait_turn)
+        cur.execute(CALENDAR_UPSERT_SQL)
+        insert_members(cur, changed, member_matcher(conn_current), year)
+        link_training_dates(cur, changed, training_date_resolver(cur, year))
+        cur.execute(RESOLVE_SQL + FACTS_UPSERT_SQL + SOURCES_UPSERT_SQL)
+        if removed:
+            cur.execute(REMOVE_RECRUITS_SQL, {"year": year, "keys": removed})
+        cur.execute("DELETE FROM quarantined_recruits WHERE source_year = %s AND recruit_key <> ALL(%s);", (year, quarantined))
+        cur.close()
+        conn_current.commit()
+    print(f"Incremental load {year}: {len(changed)} recruits upserted, {len(removed)} removed.")
+    return len(changed)
+
+
+def normalise_training_date(training_date: str) -> str:
+    """Upper-cases a training date label and collapses its whitespace"""
+    return " ".join(str(training_date).split()).upper()
+
+
+class TrainingDateResolver:
+    """Resolves training date labels to calendar ids, comparing them by normalise_training_date as
+    validate_recruits does: an exact label first, then the lowest id whose label contains it"""
+
+    def __init__(self, calendar: Iterable[tuple[int, str]]):
+        self.ids = {}
+        for training_date_id, training_date in sorted(calendar):
+            self.ids.setdefault(normalise_training_date(training_date), training_date_id)
+        self.partial_ids = {}
+
+    def id(self, training_date: str) -> int:
+        """Returns the calendar id for a training date label, or 0 if it is unknown"""
+        if training_date is None:
+            return 0
+        key = normalise_training_date(training_date)
+        if key in self.ids:
+            return self.ids[key]
+        if key not in self.partial_ids:
+            self.partial_ids[key] = next((value for candidate, value in self.ids.items() if key in candidate), 0)
+        return self.partial_ids[key]
+
+
+def training_date_resolver(cur, year: int) -> TrainingDateResolver:
+    """Builds a training date resolver over the calendar of one year, as the cursor's transaction sees it"""
+    cur.execute("""SELECT training_date_id, training_date FROM calendar_dates
+                   WHERE training_date IS NOT NULL AND EXTRACT(YEAR FROM start_date) = %s;""", (year,))
+    return TrainingDateResolver(cur.fetchall())
 
-        if result:
-            training_date_id_fk_value = result['training_date_id']
-        else:
-            training_date_id_fk_value = 0
 
-        cur.execute('INSERT INTO members(name, role_id_fk) VALUES (%s, %s) ON CONFLICT DO NOTHING', (row[0], role))
+def link_training_dates(cur, df: pd.DataFrame, training_dates: TrainingDateResolver) -> None:
+    """Resolves each training date label of the staged recruits to its calendar id and copies
+    the pairs into stage_date_links for RESOLVE_SQL"""
+    labels = df['training_date'].dropna().astype(str).drop_duplicates()
+    copy_dataframe(cur, pd.DataFrame({'training_date': labels, 'training_date_id': labels.map(training_dates.id)}),
+                   "stage_date_links")
 
-        select_query = "SELECT member_id FROM members WHERE name LIKE %s;"
-        cur.execute(select_query, ('%' + row[0] + '%',))
-        result = cur.fetchone()
 
-        if result:
-            member_id_details_fk_value = result['member_id']
+class DimensionResolver:
+    """Resolves member and training date ids from lookups loaded once per run,
+    so each lookup is a dictionary hit or a blocked fuzzy match rather than a LIKE scan on the server.
+    Training dates are looked up in the calendar of the year being loaded only."""
 
-        cur.execute('INSERT INTO member_details(member_id_details_fk, purchase, training_date_id_fk) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING', (member_id_details_fk_value, row[1], training_date_id_fk_value))
-        row[9:18] = [None if pd.isna(val) else val for val in row[9:18]]
+    def __init__(self, conn_current: connection, year: int):
+        self.cur = conn_current.cursor()
+        self.cur.execute("SELECT member_id, name FROM members WHERE name IS NOT NULL ORDER BY member_id;")
+        self.members = NameMatcher(self.cur.fetchall())
+        self.training_dates = training_date_resolver(self.cur, year)
 
-        cur.execute('INSERT INTO member_sales(member_id_fk, newcomer_demo, first_sale, second_sale, third_sale, fourth_sale, fifth_sale, sixth_sale, seventh_sale, eighth_sale) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING', (member_id_details_fk_value, row[9], row[10], row[11], row[12], row[13], row[14], row[15], row[16], row[17]))
+    def training_date_id(self, training_date: str) -> int:
+        """Returns the calendar id for a training date label, or 0 if it is unknown"""
+        return self.training_dates.id(training_date)
 
-        select_query = "SELECT member_id FROM members WHERE name LIKE %s;"
-        cur.execute(select_query, ('%' + row[2] + '%',))
-        result = cur.fetchone()
-        if result:
-            team_leader_id_value = result['member_id']
+    def member_id(self, name: str, role: int = 2, fuzzy: bool = True, create: bool = True):
+        """Returns the id for a member name, inserting the member if it is new"""
+        if name is None:
+            return None
+        result = self.members.match(name) if fuzzy else self.members.exact(name)
+        if result is not None or not create:
+            return result
+        self.cur.execute("EXECUTE insert_member(%s, %s);", (name, role))
+        result = self.cur.fetchone()[0]
+        self.members.add(result, name)
+        return result
 
-        if type(row[3]) is float:
+
+def populate_database(conn_current: connection, df: pd.DataFrame, calendar_df: pd.DataFrame = None,
+                      year: int = 2024, bulk: bool = False, wait_turn=None):
+    """Populates the database with one year of recruits from clean_recruits and, if given, its training calendar"""
+    if bulk:
+        return bulk_populate_database(conn_current, df, calendar_df, year, wait_turn)
+
+    df, rejected = screen_recruits(conn_current, df, known_training_dates(conn_current, year, calendar_df), year)
+
+    if calendar_df is not None:
+        with stage(f"load.{year}.calendar", rows_in=len(calendar_df)) as record:
+            record["rows_out"] = load_calendar(conn_current, calendar_df)
+
+    with stage(f"load.{year}.recruits", rows_in=len(df)) as record:
+        resolver = load_recruit_rows(conn_current, df, year, wait_turn)
+        report_ambiguous(resolver.members, year, record)
+        record["rows_out"] = len(df)
+    return len(df)
+
+
+def load_recruit_rows(conn_current: connection, df: pd.DataFrame, year: int, wait_turn=None) -> DimensionResolver:
+    """Inserts cleaned recruits one row at a time with the prepared statements and records their
+    fingerprints in recruit_sources, so an incremental load can follow, returning the resolver it used"""
+    prepare_statements(conn_current)
+    cur = conn_current.cursor()
+    lock_members(cur, wait_turn)
+    cur.close()
+    resolver = DimensionResolver(conn_current, year)
+    cur = conn_current.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    # Only the last row of a recruit listed twice is loaded, as in the other modes
+    staged = fingerprint_recruits(df, year)
+    member_ids = {}
+    rows = staged[df.columns].astype(object).where(staged[df.columns].notna(), None)
+    sales_rows = rows[SALE_COLUMNS].itertuples(index=False, name=None)
+    for row, sales in zip(rows.itertuples(index=False), sales_rows):
+        training_date_id_fk_value = resolver.training_date_id(row.training_date)
+        member_id_details_fk_value = resolver.member_id(row.name, row.role_id, fuzzy=False)
+        member_ids[row.name] = member_id_details_fk_value
+
+        cur.execute('EXECUTE upsert_member_details(%s, %s, %s)', (member_id_details_fk_value, row.purchase, training_date_id_fk_value))
+
+        cur.execute('EXECUTE upsert_newcomer_demo(%s, %s)', (member_id_details_fk_value, row.newcomer_demo))
+
+        cur.execute('EXECUTE delete_sale_events(%s)', (member_id_details_fk_value,))
+        sale_events = [(member_id_details_fk_value, sale_number, None if sale == 'DNQ' else sale, 'DNQ' if sale == 'DNQ' else 'SALE')
+                       for sale_number, sale in enumerate(sales, start=1) if sale is not None]
+        if sale_events:
+            psycopg2.extras.execute_values(cur, 'INSERT INTO member_sale_events(member_id_fk, sale_number, sale_date, status) VALUES %s', sale_events)
+
+        team_leader_id_value = resolver.member_id(row.team_leader, create=False)
+
+        if row.recruiting_advisor is None:
             recruiting_advisor_id_value = None
         else:
-            select_query = "SELECT member_id FROM members WHERE name LIKE %s;"
-            cur.execute(select_query, ('%' + row[3] + '%',))
-            result = cur.fetchone()
-            if result:
-                recruiting_advisor_id_value = result['member_id']
-            else:
-                cur.execute('INSERT INTO members(name, role_id_fk) VALUES (%s, %s) ON CONFLICT DO NOTHING', (row[3], 2))
-                select_query = "SELECT member_id FROM members WHERE name LIKE %s;"
-                cur.execute(select_query, ('%' + row[3] + '%',))
-                result = cur.fetchone()
-                recruiting_advisor_id_value = result['member_id']
-        cur.execute('INSERT INTO member_relationships(member_relationship_id_fk, team_leader_id, recruiting_advisor_id) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING', (member_id_details_fk_value, team_leader_id_value, recruiting_advisor_id_value))
-
+            recruiting_advisor_id_value = resolver.member_id(row.recruiting_advisor, 2)
+        cur.execute('EXECUTE upsert_relationship(%s, %s, %s)', (member_id_details_fk_value, team_leader_id_value, recruiting_advisor_id_value))
 
+    psycopg2.extras.execute_values(cur, SOURCES_VALUES_UPSERT_SQL, list(zip(
+        staged['source_year'], staged['recruit_key'], staged['name'].map(member_ids), staged['row_hash'])))
     cur.close()
     conn_current.commit()
+    return resolver
+
+
+def connection_arguments() -> dict:
+    """Returns the psycopg2 connection arguments for the DATABASE_URL"""
+    up.uses_netloc.append("postgres")
+    url = up.urlparse(environ["DATABASE_URL"])
+    return {"database": url.path[1:], "user": url.username, "password": url.password,
+            "host": url.hostname, "port": url.port}
 
 
-def get_db_connection():   # pragma: no cover
+def get_db_connection(connection_factory=None):   # pragma: no cover
     """Establishes a connection with the PostgreSQL database."""
     try:
-        up.uses_netloc.append("postgres")
-        url = up.urlparse(environ["DATABASE_URL"])
-        conn = psycopg2.connect(database=url.path[1:],
-        user=url.username,
-        password=url.password,
-        host=url.hostname,
-        port=url.port
-        )
+        conn = psycopg2.connect(**connection_arguments(), connection_factory=connection_factory)
         print("Database connection established successfully.")
         return conn
     except Error as err:
@@ -135,10 +648,36 @@ def get_db_connection():   # pragma: no cover
         sys.exit()
 
 
+def get_connection_pool(max_connections: int, connection_factory=None) -> ThreadedConnectionPool:   # pragma: no cover
+    """Opens a pool of up to max_connections connections to the PostgreSQL database that threads can share"""
+    try:
+        pool = ThreadedConnectionPool(1, max_connections, **connection_arguments(), connection_factory=connection_factory)
+        print("Database connection pool established successfully.")
+        return pool
+    except Error as err:
+        print("Error connecting to database: ", err)
+        sys.exit()
+
+
+@contextmanager
+def pooled_connection(pool: ThreadedConnectionPool):
+    """Borrows a connection from a pool, rolling back anything left uncommitted before handing it back"""
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+
+
 if __name__ == "__main__":
     # create_database()
     
     conn_thermomix = get_db_connection()
     
     create_tables(conn_thermomix)
-    populate_database(conn_thermomix)
\ No newline at end of file
+    dates_df = pd.read_excel("ExcelSheets/TRAINING AND REPORTING DATES 2024.xlsx", index_col=False, skiprows=3)[:-1]
+    populate_database(conn_thermomix, pd.read_feather("ExcelSheets/2024Recruits.feather"),
+                      generate_calendar(2024, overrides=stage_training_dates(dates_df)))
+    refresh_recruits_overview(conn_thermomix)
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""This module contains the fuzzy matching used to resolve team leader and advisor names to members."""
+import heapq
+from typing import Iterable
+import unicodedata
+
+# Similarity is 1 - edit distance / length of the longer name, so 0.85 allows about one typo in seven letters
+MATCH_THRESHOLD = 0.85
+# Candidates scoring within this of the best match are reported as ambiguous
+AMBIGUITY_MARGIN = 0.05
+# Only the members sharing the most trigrams with a name are scored
+MAX_CANDIDATES = 20
+# Each edit changes at most this many of a name's trigrams
+TRIGRAMS_PER_EDIT = 3
+# Most members a lookup reads from the trigram index, past its rarest trigram, so names made of common trigrams stay cheap
+MAX_POSTINGS = 2000
+
+
+def name_key(name: str) -> str:
+    """Case-folds a name, strips its accents and collapses its whitespace"""
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split()).casefold()
+
+
+def trigrams(key: str) -> set:
+    """Splits a name key into the trigrams used to block candidates, padded like pg_trgm"""
+    padded = f"  {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """Returns the Levenshtein distance between two strings, or limit + 1 once it is known to exceed limit"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, start=1):
+        current = [row]
+        for column, second_char in enumerate(second, start=1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1] + (first_char != second_char)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class NameMatcher:
+    """Resolves free-text member names to member ids. A name is looked up by its normalised key
+    first, then scored by edit distance against the few members sharing the most trigrams with it.
+    Candidates are only gathered from the name's rarest trigrams, so a lookup reads a few short
+    posting lists however many members there are. Names with more than one close match are kept
+    in ambiguous."""
+
+    def __init__(self, members: Iterable[tuple[int, str]] = (), threshold: float = MATCH_THRESHOLD,
+                 margin: float = AMBIGUITY_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.keys = {}
+        self.key_trigrams = {}
+        self.index = {}
+        self.ambiguous = {}
+        for member_id, name in members:
+            self.add(member_id, name)
+
+    def add(self, member_id: int, name: str) -> None:
+        """Adds a member, keeping the lowest id when two members share a key"""
+        if name is None:
+            return
+        key = name_key(name)
+        if key in self.keys:
+            self.keys[key] = min(self.keys[key], member_id)
+            return
+        self.keys[key] = member_id
+        self.key_trigrams[key] = trigrams(key)
+        for trigram in self.key_trigrams[key]:
+            self.index.setdefault(trigram, []).append(key)
+
+    def exact(self, name: str):
+        """Returns the id of the member whose normalised name is the same, or None"""
+        return self.keys.get(name_key(name))
+
+    def max_edits(self, key: str) -> int:
+        """Returns the most edits a member name can be away from a key and still match it"""
+        edits = 0
+        while int((len(key) + edits + 1) * (1 - self.threshold)) > edits:
+            edits += 1
+        return edits
+
+    def candidates(self, key: str) -> list[str]:
+        """Returns the member keys sharing the most trigrams with a key. A member close enough to match
+        lacks at most TRIGRAMS_PER_EDIT of the key's trigrams per edit, counting the ones no member has,
+        so it shares one of the rarest few left; only their postings are read, up to MAX_POSTINGS."""
+        key_trigrams = trigrams(key)
+        postings = sorted((self.index[trigram] for trigram in key_trigrams if trigram in self.index), key=len)
+        lacking = TRIGRAMS_PER_EDIT * self.max_edits(key) - (len(key_trigrams) - len(postings))
+        found = set(postings[0]) if postings else set()
+        for posting in postings[1:max(lacking + 1, 1)]:
+            if len(found) + len(posting) > MAX_POSTINGS:
+                break
+            found.update(posting)
+        shared = {candidate: len(key_trigrams & self.key_trigrams[candidate]) for candidate in found}
+        return heapq.nlargest(MAX_CANDIDATES, shared, key=lambda candidate: (shared[candidate], -self.keys[candidate]))
+
+    def match(self, name: str):
+        """Returns the id of the member a name refers to, or None if no member is close enough"""
+        if name is None:
+            return None
+        key = name_key(name)
+        if key in self.keys:
+            return self.keys[key]
+        scores = []
+        for candidate in self.candidates(key):
+            longest = max(len(key), len(candidate))
+            limit = int(longest * (1 - self.threshold))
+            distance = edit_distance(key, candidate, limit)
+            if distance <= limit:
+                scores.append((1 - distance / longest, candidate))
+        if not scores:
+            return None
+        scores.sort(key=lambda scored: (-scored[0], self.keys[scored[1]]))
+        best_score = scores[0][0]
+        close = [candidate for score, candidate in scores if best_score - score <= self.margin]
+        if len(close) > 1:
+            self.ambiguous[name] = close
+        return self.keys[scores[0][1]]
@@ -0,0 +1,132 @@
+"""Tests for the name matcher, the training calendar and the cleaning and validation of recruits"""
+import datetime
+import pandas as pd
+from Load.calendar_dates import generate_calendar
+from Load.load import TrainingDateResolver, fingerprint_recruits, validate_recruits
+from Load.name_matching import NameMatcher, name_key
+from Transform.cleaning import SALE_COLUMNS, clean_recruits, stage_training_dates
+
+TEAM_LEADERS = [(1, "Miranda Quantrill"), (2, "Ana Maria Lumina"), (3, "Judi Hampton")]
+
+SHEET_COLUMNS = ["Advisor name", "Purchase", "Team Leader", "Recruiting Advisor", "Training Date",
+                 "Unnamed: 5", "Unnamed: 6", "Unnamed: 7", "Unnamed: 8", "Newcomer demo",
+                 "1st Sale", "2nd Sale", "3rd Sale", "4th Sale", "5th Sale", "6th Sale", "7th Sale", "8th Sale"]
+
+
+def sheet_row(name, purchase="Owner", training_date="JANUARY 2024", newcomer_demo=datetime.datetime(2024, 2, 1),
+              first_sale="DNQ"):
+    """Builds one row of a transformed recruits sheet"""
+    return [name, purchase, "Judi Hampton", "Alina Matei", training_date, None, None, None, None, newcomer_demo,
+            first_sale] + [None] * 7
+
+
+def recruits_sheet(*rows):
+    """Builds a transformed recruits sheet, with the sub-header row clean_recruits drops"""
+    return pd.DataFrame([[None] * len(SHEET_COLUMNS)] + list(rows), columns=SHEET_COLUMNS)
+
+
+def test_name_key_ignores_case_accents_and_spacing():
+    assert name_key("  José   PÉREZ ") == name_key("jose perez") == "jose perez"
+
+
+def test_matcher_finds_exact_and_misspelt_names():
+    matcher = NameMatcher(TEAM_LEADERS)
+    assert matcher.exact("judi  hampton") == 3
+    assert matcher.match("Judy Hampton") == 3
+    assert matcher.match("Ana") is None
+    assert matcher.match("Someone Else") is None
+
+
+def test_matcher_keeps_the_lowest_id_for_a_shared_key():
+    matcher = NameMatcher([(7, "Judi Hampton"), (4, "JUDI HAMPTON")])
+    assert matcher.exact("Judi Hampton") == 4
+
+
+def test_matcher_reports_ambiguous_names():
+    matcher = NameMatcher([(1, "Sara Jones"), (2, "Sarah Jone")])
+    assert matcher.match("Sarah Jones") == 1
+    assert set(matcher.ambiguous["Sarah Jones"]) == {"sara jones", "sarah jone"}
+
+
+def test_matcher_finds_misspelt_names_among_many_similar_members():
+    members = [(member_id, f"Ana Maria Popescu {member_id:06d}") for member_id in range(1, 5001)]
+    matcher = NameMatcher(members)
+    assert matcher.match("Anna Maria Popescu 003141") == 3141
+
+
+def test_calendar_starts_training_on_the_first_monday_of_each_month():
+    calendar_df = generate_calendar(2024)
+    assert len(calendar_df) == 12
+    assert (calendar_df['start_date'].dt.weekday == 0).all()
+    assert (calendar_df['start_date'].dt.day <= 7).all()
+    first = calendar_df.iloc[0]
+    assert first['training_date'] == "JANUARY 2024"
+    assert first['start_date'] == pd.Timestamp("2024-01-01")
+    assert first['thirty_days'] == pd.Timestamp("2024-01-31")
+    assert first['ninety_days'] == pd.Timestamp("2024-03-31")
+    assert first['one_eighty_days'] == pd.Timestamp("2024-06-29")
+
+
+def test_calendar_overrides_replace_their_month():
+    dates_df = pd.DataFrame({"Training": ["JAN 10 - JAN 12"], "a": [None], "b": [None],
+                             "Start": [datetime.datetime(2024, 1, 10)], "30": [datetime.datetime(2024, 2, 9)],
+                             "90": [datetime.datetime(2024, 4, 9)]})
+    calendar_df = generate_calendar(2024, overrides=stage_training_dates(dates_df))
+    january = calendar_df[calendar_df['start_date'].dt.month == 1]
+    assert january['training_date'].tolist() == ["JAN 10 - JAN 12"]
+    assert len(calendar_df) == 12
+
+
+def test_clean_recruits_types_the_columns_and_drops_rows_without_a_name():
+    df = clean_recruits(recruits_sheet(sheet_row("Ava Taylor", first_sale=45299), sheet_row(None)))
+    assert df['name'].tolist() == ["Ava Taylor"]
+    assert df['training_date'].tolist() == ["JANUARY 2024"]
+    assert df['newcomer_demo'].tolist() == [pd.Timestamp("2024-02-01")]
+    assert df['first_sale'].tolist() == ["2024-01-08 00:00:00"]
+    assert df[SALE_COLUMNS[1:]].isna().all().all()
+    assert df['problems'].tolist() == [None]
+
+
+def test_validate_recruits_quarantines_cells_that_fail_before_coercion():
+    df = clean_recruits(recruits_sheet(
+        sheet_row("Valid"),
+        sheet_row("Bad Demo", newcomer_demo="soon"),
+        sheet_row("Numeric Training Date", training_date=45300),
+        sheet_row("Bad Sale", first_sale="later"),
+        sheet_row("Numeric Purchase", purchase=3),
+        sheet_row("Unknown Training Date", training_date="SMARCH")))
+    valid, rejected = validate_recruits(df, {"JANUARY 2024"})
+    assert valid['name'].tolist() == ["Valid"]
+    assert 'problems' not in valid.columns
+    assert dict(zip(rejected['name'], rejected['reason'])) == {
+        "Bad Demo": "newcomer_demo is not a date: 'soon'",
+        "Numeric Training Date": "training_date is not text: 45300",
+        "Bad Sale": "first_sale is not a date or DNQ: 'later'",
+        "Numeric Purchase": "purchase is not text: 3",
+        "Unknown Training Date": "unknown training_date: 'SMARCH'"}
+
+
+def test_validate_recruits_quarantines_a_training_column_of_dates():
+    sheet = recruits_sheet(sheet_row("Dated", training_date=datetime.datetime(2024, 1, 1)))
+    sheet["Training Date"] = pd.to_datetime(sheet["Training Date"])
+    valid, rejected = validate_recruits(clean_recruits(sheet), {"JANUARY 2024"})
+    assert valid.empty
+    assert rejected['reason'].str.startswith("training_date is not text").all()
+
+
+def test_training_dates_resolve_as_validation_compares_them():
+    resolver = TrainingDateResolver([(5, "JAN 10 - JAN 12 2024"), (2, "January  2024 "), (3, "JANUARY 2024")])
+    valid, rejected = validate_recruits(clean_recruits(recruits_sheet(
+        sheet_row("Spaced", training_date=" JANUARY   2024"), sheet_row("Part", training_date="JAN 10"))), set(resolver.ids))
+    assert rejected.empty
+    assert valid['training_date'].map(resolver.id).tolist() == [2, 5]
+    assert resolver.id("SMARCH") == 0
+    assert resolver.id(None) == 0
+
+
+def test_fingerprint_keeps_the_last_row_of_a_recruit():
+    df = clean_recruits(recruits_sheet(sheet_row("José Pérez", purchase="Owner"), sheet_row("jose  perez", purchase="Earner")))
+    staged = fingerprint_recruits(df, 2024)
+    assert staged['recruit_key'].tolist() == ["jose perez"]
+    assert staged['purchase'].tolist() == ["Earner"]
+    assert (staged['source_year'] == 2024).all()
@@ -0,0 +1,102 @@
+"""This module contains the functions that clean the recruits and training dates sheets into typed frames."""
+import pandas as pd
+from frame_schema import RECRUIT_SCHEMA, apply_schema
+
+TEAM_LEADERS = {"Miranda Quantrill","Ana Maria Lumina","Judi Hampton","Malgorzata Strzelecka","Alina Matei","Sara Joiner-Jarrett"}
+
+SALE_COLUMNS = ['first_sale', 'second_sale', 'third_sale', 'fourth_sale',
+                'fifth_sale', 'sixth_sale', 'seventh_sale', 'eighth_sale']
+
+SALE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Day zero of Excel's serial dates, which arrive as plain numbers from cells not formatted as dates
+EXCEL_EPOCH = '1899-12-30'
+
+# Columns read as they are from the sheet, which must hold text or nothing
+TEXT_COLUMNS = ['name', 'purchase', 'team_leader', 'recruiting_advisor', 'training_date']
+
+# Demo and sale dates before this are stray numbers read as serial dates rather than dates anyone typed
+EARLIEST_DATE = pd.Timestamp('2000-01-01')
+
+# The 180-day milestone falls this many days after the 90-day one
+ONE_EIGHTY_DAYS_AFTER_NINETY = 90
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Parses a column of date cells in one vectorised call, leaving NaT where it can't.
+    Numbers are Excel serial dates, so they are counted in days from EXCEL_EPOCH rather than
+    read as nanoseconds since 1970. Blank cells are left out of that conversion, as pandas can
+    raise FloatingPointError converting a column of nothing but NaN by unit."""
+    numbers = values.map(type).isin([int, float]) & values.notna()
+    serials = pd.to_datetime(pd.to_numeric(values[numbers], errors='coerce'), unit='D', origin=EXCEL_EPOCH, errors='coerce')
+    return pd.to_datetime(values.mask(numbers), errors='coerce', format='mixed').fillna(serials)
+
+
+def parse_sales(sales: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Finds the DNQ sentinels among the raw sale cells and parses the rest as dates"""
+    dnq = sales.apply(lambda column: column.astype('string').str.strip().str.upper()).eq('DNQ').fillna(False).astype(bool)
+    return dnq, sales.mask(dnq).apply(parse_dates)
+
+
+def clean_sales(sales: pd.DataFrame, dnq: pd.DataFrame, parsed: pd.DataFrame) -> pd.DataFrame:
+    """Normalises all eight sale columns at once to 'DNQ' or date text the sale events accept.
+    DNQ sentinels are kept, and cells that aren't dates are left as they are."""
+    text = sales.apply(lambda column: column.astype('string').str.strip())
+    formatted = parsed.apply(lambda column: column.dt.strftime(SALE_DATE_FORMAT))
+    cleaned = formatted.astype(object).where(parsed.notna(), text.astype(object)).mask(dnq, 'DNQ')
+    return cleaned.where(sales.notna(), None)
+
+
+def recruit_problems(cells: pd.DataFrame, failed: dict) -> pd.Series:
+    """Joins the checks each recruit failed, quoting the cells at fault, or None where it passed them all.
+    failed maps each check to the column it reads and a mask of the rows failing it."""
+    messages = [f"{check}: " + cells.loc[mask, column].astype(object).map(repr) for check, (column, mask) in failed.items()]
+    problems = pd.concat(messages).groupby(level=0, sort=False).agg("; ".join).reindex(cells.index)
+    return problems.astype(object).where(problems.notna(), None)
+
+
+def clean_recruits(recruits_df: pd.DataFrame, sub_header: bool = True) -> pd.DataFrame:
+    """Turns a transformed recruits sheet into the typed loader columns in one vectorised pass,
+    dropping the sub-header row (unless sub_header is False) and rows without an advisor name.
+    Every cell is checked as it came from the sheet before it is coerced, and the problems column
+    lists the ones that are not what their column holds, for validate_recruits to quarantine."""
+    df = recruits_df[1:] if sub_header else recruits_df
+    df = df[df.iloc[:, 0].notna()]
+    cells = df.iloc[:, [0, 1, 2, 3, 4, 9] + list(range(10, 10 + len(SALE_COLUMNS)))].reset_index(drop=True)
+    cells.columns = TEXT_COLUMNS + ['newcomer_demo'] + SALE_COLUMNS
+    text = {column: cells[column].map(type).eq(str) for column in TEXT_COLUMNS}
+    demo = parse_dates(cells['newcomer_demo'])
+    dnq, sale_dates = parse_sales(cells[SALE_COLUMNS])
+
+    failed = {f"{column} is not text": (column, cells[column].notna() & ~text[column]) for column in TEXT_COLUMNS}
+    failed['newcomer_demo is not a date'] = ('newcomer_demo', cells['newcomer_demo'].notna() & ~demo.ge(EARLIEST_DATE))
+    failed.update({f"{column} is not a date or DNQ": (column, cells[column].notna() & ~dnq[column] & ~sale_dates[column].ge(EARLIEST_DATE))
+                   for column in SALE_COLUMNS})
+
+    # Cells failing a check are left empty rather than coerced, as their recruits are quarantined with the problems
+    texts = {column: cells[column].astype(object).where(text[column], None) for column in TEXT_COLUMNS}
+    cleaned = pd.DataFrame({
+        'name': cells['name'].astype(str),
+        'role_id': cells['name'].isin(TEAM_LEADERS).map({True: 1, False: 2}),
+        'purchase': texts['purchase'],
+        'team_leader': texts['team_leader'],
+        'recruiting_advisor': texts['recruiting_advisor'],
+        'training_date': texts['training_date'].str.upper().str.rstrip(),
+        'newcomer_demo': demo.where(demo.ge(EARLIEST_DATE)).dt.normalize()
+    })
+    sales = clean_sales(cells[SALE_COLUMNS], dnq, sale_dates)
+    problems = recruit_problems(cells, failed).rename('problems')
+    return apply_schema(pd.concat([cleaned, sales, problems], axis=1), RECRUIT_SCHEMA)
+
+
+def stage_training_dates(dates_df: pd.DataFrame) -> pd.DataFrame:
+    """Maps the training dates sheet onto the calendar columns, keeping every label as text whatever its cell held"""
+    labels = dates_df.iloc[:, 0]
+    calendar_df = pd.DataFrame({
+        'training_date': labels.astype(str).where(labels.notna(), None),
+        'start_date': pd.to_datetime(dates_df.iloc[:, 3], errors='coerce'),
+        'thirty_days': pd.to_datetime(dates_df.iloc[:, 4], errors='coerce'),
+        'ninety_days': pd.to_datetime(dates_df.iloc[:, 5], errors='coerce')
+    })
+    calendar_df['one_eighty_days'] = calendar_df['ninety_days'] + pd.Timedelta(days=ONE_EIGHTY_DAYS_AFTER_NINETY)
+    return calendar_df
@@ -0,0 +1,107 @@
+"""Tests for reading and cleaning the recruits workbooks and caching their parses"""
+import datetime
+import os
+import openpyxl
+import pandas as pd
+from Benchmark.generate_workbooks import RECRUITS_HEADER, generate_workbooks
+from Transform.cleaning import parse_dates
+from Transform.transform import (cache_path, header_mismatches, read_all_years, read_cached_sheet, read_clean_workbook,
+                                 sheet_records, write_cached_sheet, year_from_name)
+
+
+def read_only_sheet(tmp_path, rows):
+    """Saves rows to a workbook and opens its sheet read-only, as the pipeline does"""
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(tmp_path / "sheet.xlsx")
+    return openpyxl.load_workbook(tmp_path / "sheet.xlsx", read_only=True).active
+
+
+def test_year_from_name_reads_the_last_number():
+    assert year_from_name("Recruits Tracker24") == 2024
+    assert year_from_name("Recruits Tracker 2223") == 2023
+    assert year_from_name("TRAINING AND REPORTING DATES 2025.xlsx") == 2025
+    assert year_from_name("Recruits Tracker") is None
+
+
+def test_sheet_records_cuts_rows_to_the_header_and_drops_trailing_blank_rows(tmp_path):
+    worksheet = read_only_sheet(tmp_path, [
+        [" Advisor name ", None, "Team Leader"],
+        ["Ava Taylor", "Owner", "Judi Hampton", "stray note"],
+        [None, None, None],
+        ["Mia Jones", None, "Alina Matei"],
+        [None, None, None],
+        [None, None, None]])
+    columns, records = sheet_records(worksheet)
+    assert columns == ["Advisor name", "Unnamed: 1", "Team Leader"]
+    assert list(records) == [("Ava Taylor", "Owner", "Judi Hampton"), (None, None, None),
+                             ("Mia Jones", None, "Alina Matei")]
+
+
+def test_sheet_records_of_an_empty_sheet(tmp_path):
+    columns, records = sheet_records(read_only_sheet(tmp_path, []))
+    assert columns is None
+    assert list(records) == []
+
+
+def test_header_mismatches_ignores_case_and_spacing():
+    assert header_mismatches(["advisor  NAME"] + RECRUITS_HEADER[1:]) == []
+    assert header_mismatches(["Name"] + RECRUITS_HEADER[1:]) == ["column 1 is 'Name', expected 'Advisor name'"]
+    assert len(header_mismatches(RECRUITS_HEADER[:4])) == 10
+    assert header_mismatches(None)
+
+
+def test_read_clean_workbook_reads_every_recruits_sheet_from_one_open(tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Notes"
+    for sheet_name, header in [("Recruits Tracker24", RECRUITS_HEADER), ("Recruits Tracker 2223", RECRUITS_HEADER),
+                               ("Recruits Tracker", RECRUITS_HEADER), ("Recruits Tracker25", ["Name"] + RECRUITS_HEADER[1:])]:
+        sheet = workbook.create_sheet(sheet_name)
+        for row in [header, [None] * len(header), ["Ava Taylor", "Owner", "Judi Hampton", None, "JANUARY 2024"]]:
+            sheet.append(row)
+    workbook.save(tmp_path / "Recruits.xlsx")
+    opens = []
+    load_workbook = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, "load_workbook", lambda *args, **kwargs: opens.append(args) or load_workbook(*args, **kwargs))
+    sheets = read_clean_workbook(str(tmp_path / "Recruits.xlsx"))
+    assert len(opens) == 1
+    assert list(sheets) == ["Recruits Tracker24", "Recruits Tracker 2223", "Recruits Tracker", "Recruits Tracker25"]
+    assert sheets["Recruits Tracker24"][1]['name'].tolist() == sheets["Recruits Tracker 2223"][1]['name'].tolist() == ["Ava Taylor"]
+    assert sheets["Recruits Tracker"][1] is None
+    assert sheets["Recruits Tracker25"] == (["Name"] + RECRUITS_HEADER[1:], None)
+
+
+def test_parse_dates_reads_numbers_as_excel_serial_dates():
+    parsed = parse_dates(pd.Series([45299, "2024-01-08", datetime.datetime(2024, 1, 8), None, "soon"], dtype=object))
+    assert parsed[:3].tolist() == [pd.Timestamp("2024-01-08")] * 3
+    assert parsed[3:].isna().all()
+
+
+def test_cached_sheet_round_trip_keeps_the_newest_versions(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    df = pd.DataFrame({"name": ["Ava Taylor", None], "newcomer_demo": pd.to_datetime(["2024-02-01", None])})
+    assert read_cached_sheet(cache_dir, "Recruits.xlsx", "Recruits Tracker24", "a" * 64) is None
+    for saved, content_hash in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        write_cached_sheet(cache_dir, "Recruits.xlsx", "Recruits Tracker24", content_hash, df, versions=2)
+        # Spaces the copies out in time, as workbook saves are, so eviction can order them
+        os.utime(cache_path(cache_dir, "Recruits.xlsx", "Recruits Tracker24", content_hash), (saved, saved))
+    pd.testing.assert_frame_equal(read_cached_sheet(cache_dir, "Recruits.xlsx", "Recruits Tracker24", "c" * 64), df)
+    assert read_cached_sheet(cache_dir, "Recruits.xlsx", "Recruits Tracker24", "b" * 64) is not None
+    assert not os.path.exists(cache_path(cache_dir, "Recruits.xlsx", "Recruits Tracker24", "a" * 64))
+
+
+def test_warm_cache_returns_what_a_cold_parse_does_without_opening_a_workbook(tmp_path, monkeypatch):
+    generate_workbooks(str(tmp_path), 200)
+    cache_dir = str(tmp_path / ".cache")
+    cold_recruits, cold_dates = read_all_years(str(tmp_path), max_workers=2, cache_dir=cache_dir)
+
+    def refuse(*args, **kwargs):
+        raise AssertionError("a warm run opened a workbook")
+    monkeypatch.setattr(openpyxl, "load_workbook", refuse)
+    monkeypatch.setattr(pd, "read_excel", refuse)
+    warm_recruits, warm_dates = read_all_years(str(tmp_path), max_workers=2, cache_dir=cache_dir)
+    assert list(cold_recruits) == list(warm_recruits) == [2024]
+    assert len(cold_recruits[2024]) == 200
+    pd.testing.assert_frame_equal(cold_recruits[2024], warm_recruits[2024])
+    pd.testing.assert_frame_equal(cold_dates[2024], warm_dates[2024])
@@ -1,26 +1,393 @@
 """This module contains functions used to transform the data into the appropriate output form."""
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from glob import escape, glob
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+from xml.etree import ElementTree
 import pandas as pd
+import openpyxl
+import hashlib
+import json
+import zipfile
 import os
+import re
+from run_report import stage
+from Transform.cleaning import clean_recruits, stage_training_dates
+
+RECRUITS_SHEET_PATTERN = "Recruits Tracker*"
+TRAINING_DATES_PATTERN = "TRAINING AND REPORTING DATES*.xlsx"
+RECRUIT_COLUMN_COUNT = 18
+# The header cells of the columns the loader reads by position; sheets laid out any other way are skipped
+RECRUITS_HEADER = {0: "Advisor name", 1: "Purchase", 2: "Team Leader", 3: "Recruiting Advisor", 4: "Training Date",
+                   9: "Newcomer demo", 10: "1st Sale", 11: "2nd Sale", 12: "3rd Sale", 13: "4th Sale",
+                   14: "5th Sale", 15: "6th Sale", 16: "7th Sale", 17: "8th Sale"}
+RECRUIT_CHUNK_SIZE = 5000
+WORKBOOK_CACHE = "ExcelSheets/.cache"
+CACHE_VERSIONS = 2
+# Bumped whenever the cached frames change shape, so older caches are re-parsed rather than misread
+CACHE_FORMAT = 2
+SPREADSHEET_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIP_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def discover_workbooks(source: str = 'ExcelSheets') -> tuple[list[str], list[str]]:
+    """Splits the workbooks in the source folder into recruits workbooks and training dates workbooks"""
+    files = sorted(file for file in os.listdir(os.path.abspath(source))
+                   if file.endswith(".xlsx") and not file.startswith("~$"))
+    recruits = [f"{source}/{file}" for file in files if not fnmatch(file, TRAINING_DATES_PATTERN)]
+    training_dates = [f"{source}/{file}" for file in files if fnmatch(file, TRAINING_DATES_PATTERN)]
+    return recruits, training_dates
+
+
+def find_recruits_workbook() -> str:
+    """Finds the recruits workbook in the ExcelSheets folder"""
+    return discover_workbooks()[0][0]
+
+
+def year_from_name(name: str) -> int:
+    """Works out the year a sheet or file covers from the last number in its name,
+    e.g. 'Recruits Tracker24' and 'Recruits Tracker 2223' give 2024 and 2023"""
+    numbers = re.findall(r"\d+", name)
+    return 2000 + int(numbers[-1][-2:]) if numbers else None
+
+
+def sheet_records(worksheet, max_columns: int = RECRUIT_COLUMN_COUNT) -> tuple[list[str], Iterator[tuple]]:
+    """Returns the column names of a read-only worksheet and a lazy iterator over its rows,
+    cut to the header width and stopping at the last non-empty row"""
+    rows = worksheet.iter_rows(max_col=max_columns, values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return None, iter(())
+    width = max((index + 1 for index, name in enumerate(header) if name is not None), default=0)
+    columns = [f"Unnamed: {index}" if name is None else str(name).strip() for index, name in enumerate(header[:width])]
+
+    def records():
+        blank_rows = []
+        for row in rows:
+            row = row[:width]
+            if all(cell is None for cell in row):
+                blank_rows.append(row)
+                continue
+            yield from blank_rows
+            blank_rows = []
+            yield row
+    return columns, records()
+
+
+def header_mismatches(columns: list[str]) -> list[str]:
+    """Lists the cells of a recruits sheet's header that differ from RECRUITS_HEADER, ignoring case and spacing"""
+    columns = columns or []
+    mismatches = []
+    for index, expected in RECRUITS_HEADER.items():
+        found = columns[index] if index < len(columns) else None
+        if found is None or " ".join(found.split()).casefold() != expected.casefold():
+            mismatches.append(f"column {index + 1} is {found!r}, expected {expected!r}")
+    return mismatches
+
+
+def read_recruits_headers(path: str, pattern: str = RECRUITS_SHEET_PATTERN) -> dict[str, list[str]]:
+    """Reads the header row of every recruits sheet in a workbook without reading the rest of their cells"""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return {sheet_name: sheet_records(workbook[sheet_name])[0]
+                for sheet_name in workbook.sheetnames if fnmatch(sheet_name, pattern)}
+    finally:
+        workbook.close()
+
+
+def iter_recruits_sheets(path: str = None, pattern: str = RECRUITS_SHEET_PATTERN,
+                         max_columns: int = RECRUIT_COLUMN_COUNT) -> Iterator[tuple[str, pd.DataFrame]]:
+    """Opens the workbook once in read-only mode and yields a dataframe for every
+    sheet matching the pattern, reading only the first max_columns columns and
+    stopping at the last non-empty row"""
+    workbook = openpyxl.load_workbook(path or find_recruits_workbook(), read_only=True, data_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            if not fnmatch(sheet_name, pattern):
+                continue
+            columns, records = sheet_records(workbook[sheet_name], max_columns)
+            if columns is None:
+                continue
+            yield sheet_name, pd.DataFrame.from_records(list(records), columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_recruits_chunks(path: str, sheet_name: str, chunk_size: int = RECRUIT_CHUNK_SIZE, skip: int = 0) -> Iterator[pd.DataFrame]:
+    """Streams one recruits sheet as dataframes of at most chunk_size rows, so only one
+    chunk of the sheet is held in memory at a time. The first skip chunks are read past
+    without being built."""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        columns, records = sheet_records(workbook[sheet_name])
+        next(islice(records, skip * chunk_size, skip * chunk_size), None)
+        while columns is not None:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame.from_records(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def list_recruits_sheets(path: str, pattern: str = RECRUITS_SHEET_PATTERN) -> list[str]:
+    """Lists the recruits sheets in a workbook without reading their cells"""
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [sheet_name for sheet_name in workbook.sheetnames if fnmatch(sheet_name, pattern)]
+    finally:
+        workbook.close()
+
+
+def read_recruits_sheet(path: str, sheet_name: str) -> pd.DataFrame:
+    """Reads a single recruits sheet, raising ValueError if its header doesn't match RECRUITS_HEADER"""
+    df = next(df for _, df in iter_recruits_sheets(path, pattern=escape(sheet_name)))
+    mismatches = header_mismatches(list(df.columns))
+    if mismatches:
+        raise ValueError(f"'{sheet_name}' in {path} is not laid out like a recruits sheet: {'; '.join(mismatches)}")
+    return df
+
+
+def turn_training_dates_xls_to_dataframe(path: str) -> pd.DataFrame:
+    """Turns a training and reporting dates workbook into a pandas dataframe"""
+    return pd.read_excel(path, index_col=False, skiprows=3)[:-1]
+
+
+def read_clean_recruits(path: str, sheet_name: str) -> pd.DataFrame:
+    """Reads a single recruits sheet and cleans it into the typed columns the loaders take"""
+    return clean_recruits(read_recruits_sheet(path, sheet_name))
+
+
+def readable_sheet(sheet_name: str, columns: list[str]) -> bool:
+    """Tells whether the loader can read a recruits sheet: it needs a year in its name and the RECRUITS_HEADER layout"""
+    return year_from_name(sheet_name) is not None and not header_mismatches(columns)
+
+
+def read_clean_workbook(path: str, pattern: str = RECRUITS_SHEET_PATTERN) -> dict[str, tuple[list[str], pd.DataFrame]]:
+    """Opens a recruits workbook once and returns the header of every recruits sheet in it, with the sheet's
+    cleaned recruits, or None in their place for a sheet the loader can't read"""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for sheet_name in workbook.sheetnames:
+            if not fnmatch(sheet_name, pattern):
+                continue
+            columns, records = sheet_records(workbook[sheet_name])
+            df = None
+            if readable_sheet(sheet_name, columns):
+                df = clean_recruits(pd.DataFrame.from_records(list(records), columns=columns))
+            sheets[sheet_name] = (columns, df)
+        return sheets
+    finally:
+        workbook.close()
+
+
+def read_training_dates(path: str) -> pd.DataFrame:
+    """Reads a training and reporting dates workbook into the calendar rows that override the generated ones"""
+    return stage_training_dates(turn_training_dates_xls_to_dataframe(path))
+
+
+def file_hash(path: str) -> str:
+    """Returns the SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sheet_fingerprints(path: str) -> dict[str, str]:
+    """Hashes each sheet's XML in a workbook together with the shared strings, so the sheets that
+    changed between two saves can be told apart without parsing any cells"""
+    with zipfile.ZipFile(path) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relations = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {relation.get("Id"): relation.get("Target") for relation in relations}
+        shared_strings = archive.read("xl/sharedStrings.xml") if "xl/sharedStrings.xml" in archive.namelist() else b""
+        fingerprints = {}
+        for sheet in workbook.iter(f"{{{SPREADSHEET_NAMESPACE}}}sheet"):
+            target = targets[sheet.get(f"{{{RELATIONSHIP_NAMESPACE}}}id")]
+            member = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            fingerprints[sheet.get("name")] = hashlib.sha256(archive.read(member) + shared_strings).hexdigest()
+    return fingerprints
+
+
+def assign_years(headers: dict[str, dict[str, list[str]]]) -> dict[int, tuple[str, str]]:
+    """Picks the recruits sheet of every year from the header rows of each workbook's recruits sheets.
+    Sheets whose header doesn't match RECRUITS_HEADER are skipped, as the loader reads columns by position."""
+    sheets = {}
+    for path, sheet_headers in headers.items():
+        for sheet_name, columns in sheet_headers.items():
+            year = year_from_name(sheet_name)
+            mismatches = header_mismatches(columns)
+            if year is None:
+                print(f"Skipping '{sheet_name}' in {path}: no year in the sheet name.")
+            elif mismatches:
+                print(f"Skipping '{sheet_name}' in {path}: its header doesn't match the recruits layout ({'; '.join(mismatches)}).")
+            elif year in sheets:
+                raise ValueError(f"Found more than one recruits sheet for {year}: '{sheet_name}' in {path}")
+            else:
+                sheets[year] = (path, sheet_name)
+    return sheets
+
+
+def discover_years(source: str = 'ExcelSheets') -> tuple[dict[int, tuple[str, str]], dict[int, str]]:
+    """Finds the recruits sheet and the training dates workbook of every year in the source folder"""
+    recruits_paths, training_dates_paths = discover_workbooks(source)
+    sheets = assign_years({path: read_recruits_headers(path) for path in recruits_paths})
+    training_dates = {year_from_name(os.path.basename(path)): path for path in training_dates_paths}
+    return sheets, training_dates
+
+
+def cache_path(cache_dir: str, path: str, sheet_name: str, content_hash: str) -> str:
+    """Names the cached copy of a parsed sheet after its workbook, sheet, content hash and the cache format"""
+    return os.path.join(cache_dir, f"{Path(path).stem} - {sheet_name}.{content_hash[:16]}.v{CACHE_FORMAT}.feather")
+
+
+def read_cached_sheet(cache_dir: str, path: str, sheet_name: str, content_hash: str) -> pd.DataFrame:
+    """Returns the cached parse of a sheet for this version of the workbook, or None"""
+    cached = cache_path(cache_dir, path, sheet_name, content_hash)
+    return read_checkpoint(cached) if os.path.exists(cached) else None
+
+
+def write_cached_sheet(cache_dir: str, path: str, sheet_name: str, content_hash: str, df: pd.DataFrame,
+                       versions: int = CACHE_VERSIONS) -> None:
+    """Caches the parse of a sheet, evicting all but the newest versions of the same sheet"""
+    os.makedirs(cache_dir, exist_ok=True)
+    write_checkpoint(df, cache_path(cache_dir, path, sheet_name, content_hash))
+    evict_cached(os.path.join(escape(cache_dir), escape(f"{Path(path).stem} - {sheet_name}.") + "*.feather"), versions)
+
+
+def evict_cached(pattern: str, versions: int) -> None:
+    """Removes all but the newest versions of the cached files matching a glob pattern"""
+    for stale in sorted(glob(pattern), key=os.path.getmtime, reverse=True)[versions:]:
+        os.remove(stale)
+
+
+def headers_path(cache_dir: str, path: str, content_hash: str) -> str:
+    """Names the cached header rows of a recruits workbook after the workbook, its content hash and the cache format"""
+    return os.path.join(cache_dir, f"{Path(path).stem}.{content_hash[:16]}.v{CACHE_FORMAT}.json")
+
+
+def read_cached_workbook(cache_dir: str, path: str, content_hash: str) -> dict[str, tuple[list[str], pd.DataFrame]]:
+    """Returns the cached parse of a recruits workbook for this version of it, in the form read_clean_workbook
+    gives, or None if its header rows or the frame of any sheet the loader reads aren't cached"""
+    cached = headers_path(cache_dir, path, content_hash)
+    if not os.path.exists(cached):
+        return None
+    with open(cached) as source:
+        headers = json.load(source)
+    sheets = {}
+    for sheet_name, columns in headers.items():
+        df = None
+        if readable_sheet(sheet_name, columns):
+            df = read_cached_sheet(cache_dir, path, sheet_name, content_hash)
+            if df is None:
+                return None
+        sheets[sheet_name] = (columns, df)
+    return sheets
+
+
+def write_cached_workbook(cache_dir: str, path: str, content_hash: str, sheets: dict[str, tuple[list[str], pd.DataFrame]],
+                          versions: int = CACHE_VERSIONS) -> None:
+    """Caches the parse of a recruits workbook: the frame of every sheet the loader reads, then the header
+    rows of all its recruits sheets, evicting all but the newest versions of each"""
+    for sheet_name, (_, df) in sheets.items():
+        if df is not None:
+            write_cached_sheet(cache_dir, path, sheet_name, content_hash, df, versions)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(headers_path(cache_dir, path, content_hash), "w") as target:
+        json.dump({sheet_name: columns for sheet_name, (columns, _) in sheets.items()}, target)
+    evict_cached(os.path.join(escape(cache_dir), escape(f"{Path(path).stem}.") + "*.json"), versions)
+
+
+def read_all_years(source: str = 'ExcelSheets', max_workers: int = None,
+                   cache_dir: str = None) -> tuple[dict[int, pd.DataFrame], dict[int, pd.DataFrame]]:
+    """Discovers every recruits sheet and training dates workbook in the source folder and
+    parses them in parallel, one process per workbook, returning the cleaned recruits and the
+    staged training dates keyed by year. Each job opens its workbook once and parses all of its
+    sheets, so a workbook's sheets share one process rather than spreading over the pool. Given a
+    cache_dir, workbooks whose content hasn't changed are read from the cache instead, without
+    being opened: the cache holds the header rows of their recruits sheets as well as the cleaned,
+    typed frames, so a warm run finds and loads exactly what a cold one would."""
+    with stage("transform.discover") as record:
+        recruits_paths, training_dates_paths = discover_workbooks(source)
+        record["rows_out"] = len(recruits_paths) + len(training_dates_paths)
+
+    workbooks, calendars = {}, {}
+    if cache_dir:
+        with stage("transform.cache", rows_in=len(recruits_paths) + len(training_dates_paths)) as record:
+            hashes = {path: file_hash(path) for path in recruits_paths + training_dates_paths}
+            for path in recruits_paths:
+                sheets = read_cached_workbook(cache_dir, path, hashes[path])
+                if sheets is not None:
+                    workbooks[path] = sheets
+            for path in training_dates_paths:
+                df = read_cached_sheet(cache_dir, path, "training dates", hashes[path])
+                if df is not None:
+                    calendars[path] = df
+            record["rows_out"] = len(workbooks) + len(calendars)
+    misses = {path: read_clean_workbook for path in recruits_paths if path not in workbooks}
+    misses.update({path: read_training_dates for path in training_dates_paths if path not in calendars})
+
+    with stage("transform.parse", rows_in=len(misses)) as record:
+        if misses:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {path: pool.submit(parse, path) for path, parse in misses.items()}
+                for path, future in futures.items():
+                    if misses[path] is read_clean_workbook:
+                        workbooks[path] = future.result()
+                    else:
+                        calendars[path] = future.result()
+        record["rows_out"] = sum(len(calendars[path]) if path in calendars else
+                                 sum(len(df) for _, df in workbooks[path].values() if df is not None) for path in misses)
+
+    sheets = assign_years({path: {sheet_name: columns for sheet_name, (columns, _) in workbooks[path].items()}
+                           for path in recruits_paths})
+
+    if cache_dir and misses:
+        with stage("transform.write_cache", rows_in=len(misses)):
+            for path in misses:
+                if path in workbooks:
+                    write_cached_workbook(cache_dir, path, hashes[path], workbooks[path])
+                else:
+                    write_cached_sheet(cache_dir, path, "training dates", hashes[path], calendars[path])
+
+    recruits = {year: workbooks[path][sheet_name][1] for year, (path, sheet_name) in sorted(sheets.items())}
+    training_dates = {year_from_name(os.path.basename(path)): calendars[path] for path in training_dates_paths}
+    return recruits, dict(sorted(training_dates.items()))
+
+
+def read_recruits_workbook(path: str = None) -> dict[str, pd.DataFrame]:
+    """Reads every recruits sheet from a single pass over the workbook"""
+    return dict(iter_recruits_sheets(path))
+
+
+def write_checkpoint(df: pd.DataFrame, path: str) -> None:
+    """Writes a cleaned dataframe to a Feather checkpoint, keeping column types"""
+    from pyarrow import feather
+    feather.write_feather(df, path)
+
+
+def read_checkpoint(path: str) -> pd.DataFrame:
+    """Memory-maps a Feather checkpoint back into a dataframe"""
+    from pyarrow import feather
+    return feather.read_table(path, memory_map=True).to_pandas()
 
 
 def turn_2023_recruits_xls_to_dataframe() -> pd.DataFrame:
     """Finds the file and turns it into a pandas dataframe"""
-    source = os.path.abspath('ExcelSheets/')
-    files = [file for file in os.listdir(source) if ".xlsx" in file]
-    df = pd.read_excel(f"ExcelSheets/{files[0]}", index_col=False, sheet_name='Recruits Tracker 2223')
-    df.columns = df.columns.str.strip()
-    return df
+    return next(df for _, df in iter_recruits_sheets(pattern='Recruits Tracker 2223'))
 
 
 def turn_2024_recruits_xls_to_dataframe() -> pd.DataFrame:
     """Finds the file and turns it into a pandas dataframe"""
-    source = os.path.abspath('ExcelSheets/')
-    files = [file for file in os.listdir(source) if ".xlsx" in file]
-    df = pd.read_excel(f"ExcelSheets/{files[0]}", index_col=False, sheet_name='Recruits Tracker24')
-    df.columns = df.columns.str.strip()
-    return df
+    return next(df for _, df in iter_recruits_sheets(pattern='Recruits Tracker24'))
 
 
 if __name__ == "__main__":
-    recruits_df_2023 = turn_2023_recruits_xls_to_dataframe()
-    recruits_df_2024 = turn_2024_recruits_xls_to_dataframe()
+    recruits_sheets = read_recruits_workbook()
+    recruits_df_2023 = recruits_sheets['Recruits Tracker 2223']
+    recruits_df_2024 = recruits_sheets['Recruits Tracker24']
@@ -0,0 +1 @@
+"""Puts the ETL Pipeline folder on the path, so tests import Load and Transform as the pipeline does"""
@@ -0,0 +1,39 @@
+"""This module contains the column dtypes of the pipeline's dataframes and the function that applies them."""
+import pandas as pd
+
+# 'category' for low-cardinality text, 'datetime' for dates and 'id' for integer keys to downcast
+RECRUIT_SCHEMA = {
+    'role_id': 'id',
+    'purchase': 'category',
+    'team_leader': 'category',
+    'training_date': 'category',
+    'newcomer_demo': 'datetime'
+}
+
+REPORT_SCHEMA = {
+    'member_id': 'id',
+    'team_leader_name': 'category',
+    'role_name': 'category',
+    'purchase': 'category',
+    'training_date': 'category',
+    'start_date': 'datetime',
+    'thirty_days': 'datetime',
+    'ninety_days': 'datetime',
+    'one_eighty_days': 'datetime',
+    'newcomer_demo': 'datetime'
+}
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """Casts the columns of a dataframe named in a schema to their compact dtypes"""
+    columns = {}
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        if kind == 'id':
+            columns[column] = pd.to_numeric(df[column], downcast='integer')
+        elif kind == 'datetime':
+            columns[column] = pd.to_datetime(df[column], errors='coerce')
+        else:
+            columns[column] = df[column].astype(kind)
+    return df.assign(**columns)
@@ -1,25 +1,169 @@
 """Main code that runs the pipeline"""
+import argparse
+import cProfile
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import threading
+from glob import glob
 from Transform.transform import *
 from Load.load import *
+from Load.calendar_dates import generate_calendar
+from run_report import InstrumentedConnection, stage, write_report
+from watch import DEBOUNCE_SECONDS, WorkbookWatcher
 
-if __name__ == "__main__":
 
-    # Transform
+def stream_pipeline(args: argparse.Namespace) -> None:
+    """Streams every year of recruits into the database in chunks, one transaction per chunk"""
+    with stage("transform.discover") as record:
+        sheets, training_dates = discover_years()
+        record["rows_out"] = len(sheets) + len(training_dates)
+
+    conn_thermomix = get_db_connection(connection_factory=InstrumentedConnection)
+
+    if not args.resume:
+        with stage("load.create_tables"):
+            create_tables(conn_thermomix)
+
+    for year, (path, sheet_name) in sorted(sheets.items()):
+        source_hash = file_hash(path)
+        chunk_size, first_chunk = args.chunk_size, 0
+        checkpoint = read_load_checkpoint(conn_thermomix, year) if args.resume else None
+        if checkpoint:
+            if checkpoint["source_hash"] != source_hash:
+                raise ValueError(f"{path} has changed since {year} was checkpointed; run a full load instead of --resume")
+            if checkpoint["completed"]:
+                print(f"Skipping {year}: already loaded.")
+                continue
+            chunk_size, first_chunk = checkpoint["batch_size"], checkpoint["last_batch"] + 1
+            print(f"Resuming {year} from batch {first_chunk}.")
+
+        dates_df = read_training_dates(training_dates[year]) if year in training_dates else None
+        calendar_df = generate_calendar(year, overrides=dates_df)
+        with stage(f"load.{year}") as record:
+            chunks = iter_recruits_chunks(path, sheet_name, chunk_size, skip=first_chunk)
+            record["rows_out"] = stream_populate_database(conn_thermomix, chunks, calendar_df, year, source_hash=source_hash,
+                                                          batch_size=chunk_size, first_chunk=first_chunk)
+
+    refresh_recruits_overview(conn_thermomix)
+    conn_thermomix.close()
+
+
+class YearTurns:
+    """Lets the loads of several years run side by side while making them match and insert members
+    in year order, so recruits listed in more than one year resolve as they would in a sequential run"""
+
+    def __init__(self, years):
+        self.years = sorted(years)
+        self.finished = set()
+        self.condition = threading.Condition()
+
+    def wait(self, year: int) -> None:
+        """Blocks until every earlier year has finished loading"""
+        with self.condition:
+            self.condition.wait_for(lambda: all(earlier in self.finished for earlier in self.years if earlier < year))
+
+    def finish(self, year: int) -> None:
+        """Marks a year as loaded, or as failed, letting the next one go ahead"""
+        with self.condition:
+            self.finished.add(year)
+            self.condition.notify_all()
+
 
-    recruits_df_2023 = turn_2023_recruits_xls_to_dataframe()
+def load_year(pool, turns: YearTurns, year: int, recruits_df, calendar_df, args: argparse.Namespace) -> int:
+    """Loads one year of recruits on a connection borrowed from the pool"""
+    try:
+        with pooled_connection(pool) as conn_thermomix, stage(f"load.{year}", rows_in=len(recruits_df)) as record:
+            if args.incremental:
+                record["rows_out"] = incremental_populate_database(conn_thermomix, recruits_df, calendar_df, year,
+                                                                   wait_turn=lambda: turns.wait(year))
+            else:
+                record["rows_out"] = populate_database(conn_thermomix, recruits_df, calendar_df, year, bulk=args.bulk,
+                                                       wait_turn=lambda: turns.wait(year))
+            return record["rows_out"]
+    finally:
+        turns.finish(year)
 
-    recruits_df_2024 = turn_2024_recruits_xls_to_dataframe()
 
-    recruits_df_2023.to_csv("ExcelSheets/2023Recruits.csv", index=False)   
-    
-    recruits_df_2024.to_csv("ExcelSheets/2024Recruits.csv", index=False) 
+def run_pipeline(args: argparse.Namespace) -> None:
+    """Transforms every year of recruits and loads them into the database"""
+
+    if args.watch:
+        return WorkbookWatcher().watch(args.debounce)
+    if args.stream or args.resume:
+        return stream_pipeline(args)
+
+    # Transform
+
+    if args.from_checkpoint:
+        with stage("transform.checkpoint") as record:
+            recruits_by_year = {year_from_name(os.path.basename(path)): read_checkpoint(path)
+                                for path in sorted(glob("ExcelSheets/*Recruits.feather"))}
+            training_dates_by_year = {year_from_name(os.path.basename(path)): read_training_dates(path)
+                                      for path in discover_workbooks()[1]}
+            record["rows_out"] = sum(len(df) for df in recruits_by_year.values())
+    else:
+        recruits_by_year, training_dates_by_year = read_all_years(max_workers=args.workers,
+                                                                  cache_dir=None if args.no_cache else WORKBOOK_CACHE)
+
+        if args.checkpoint:
+            with stage("transform.write_checkpoint"):
+                for year, recruits_df in recruits_by_year.items():
+                    write_checkpoint(recruits_df, f"ExcelSheets/{year}Recruits.feather")
 
     # Load
 
     # create_database()
-    
-    conn_thermomix = get_db_connection()
-    
-    create_tables(conn_thermomix)
 
-    populate_database(conn_thermomix)
\ No newline at end of file
+    pool = get_connection_pool(args.jobs, connection_factory=InstrumentedConnection)
+
+    if not args.incremental:
+        with stage("load.create_tables"), pooled_connection(pool) as conn_thermomix:
+            create_tables(conn_thermomix)
+
+    # Each year loads in its own transaction on its own pooled connection, so with --jobs above 1
+    # the validation and staging of different years run at the same time
+    turns = YearTurns(recruits_by_year)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = []
+        for year, recruits_df in sorted(recruits_by_year.items()):
+            dates_df = training_dates_by_year.get(year)
+            calendar_df = generate_calendar(year, overrides=dates_df)
+            futures.append(executor.submit(copy_context().run, load_year, pool, turns, year, recruits_df, calendar_df, args))
+        for future in futures:
+            future.result()
+
+    with pooled_connection(pool) as conn_thermomix:
+        refresh_recruits_overview(conn_thermomix)
+    pool.closeall()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Runs the recruits ETL pipeline")
+    parser.add_argument("--bulk", action="store_true", help="load through COPY-filled staging tables")
+    parser.add_argument("--incremental", action="store_true", help="apply only new, changed and removed recruits")
+    parser.add_argument("--watch", action="store_true", help="keep running and apply workbook changes as they are saved")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="seconds of quiet to wait for in --watch mode")
+    parser.add_argument("--stream", action="store_true", help="read and load each sheet in chunks with bounded memory")
+    parser.add_argument("--chunk-size", type=int, default=RECRUIT_CHUNK_SIZE, help="recruits per chunk in --stream mode")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted --stream load from its last committed batch")
+    parser.add_argument("--checkpoint", action="store_true", help="write the transformed recruits to Feather checkpoints")
+    parser.add_argument("--from-checkpoint", action="store_true", help="load from the Feather checkpoints instead of the workbook")
+    parser.add_argument("--no-cache", action="store_true", help="re-parse every workbook instead of using the parsed-sheet cache")
+    parser.add_argument("--jobs", type=int, default=1, help="years loaded at the same time, each on its own pooled connection")
+    parser.add_argument("--workers", type=int, default=None, help="processes used to parse the workbooks")
+    parser.add_argument("--report", default="run_report.json", help="where to write the JSON run report")
+    parser.add_argument("--profile", default=None, help="write a cProfile dump of the run to this path")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        with stage("pipeline"):
+            run_pipeline(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        write_report(args.report, arguments=vars(args))
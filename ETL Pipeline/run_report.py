@@ -0,0 +1,87 @@
+"""This module contains the instrumentation used to time pipeline stages and write a run report."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from psycopg2.extensions import connection, cursor
+import json
+import threading
+import time
+
+stages = []
+# The stages running in the current context; a thread started with contextvars.copy_context()
+# counts its SQL towards the stages that were running when it was submitted
+active_stages = ContextVar("active_stages", default=())
+counts_lock = threading.Lock()
+
+
+@contextmanager
+def stage(name: str, rows_in: int = None):
+    """Times a pipeline stage and collects the rows and SQL it handles. The caller can set
+    rows_out on the yielded record; nested stages also count towards their parents."""
+    record = {"stage": name, "started_at": datetime.now().isoformat(), "wall_seconds": None,
+              "rows_in": rows_in, "rows_out": None, "statements": 0, "round_trips": 0}
+    stages.append(record)
+    token = active_stages.set(active_stages.get() + (record,))
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = round(time.perf_counter() - start, 6)
+        active_stages.reset(token)
+
+
+def count_sql(statements: int, round_trips: int = 1) -> None:
+    """Adds SQL statements and server round trips to every running stage"""
+    with counts_lock:
+        for record in active_stages.get():
+            record["statements"] += statements
+            record["round_trips"] += round_trips
+
+
+def statement_count(query) -> int:
+    """Counts the statements in a query string"""
+    if isinstance(query, bytes):
+        query = query.decode()
+    return max(1, len([part for part in str(query).split(";") if part.strip()]))
+
+
+@lru_cache(maxsize=None)
+def counting_cursor(cursor_factory: type) -> type:
+    """Builds a subclass of a cursor class that counts the SQL it sends"""
+    class CountingCursor(cursor_factory):
+        def execute(self, query, vars=None):
+            count_sql(statement_count(query))
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            count_sql(len(vars_list), len(vars_list))
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            count_sql(1)
+            return super().copy_expert(sql, file, size)
+
+    return CountingCursor
+
+
+class InstrumentedConnection(connection):
+    """A psycopg2 connection whose cursors and commits are counted in the run report"""
+
+    def cursor(self, *args, **kwargs):
+        cursor_factory = kwargs.get("cursor_factory") or self.cursor_factory or cursor
+        kwargs["cursor_factory"] = counting_cursor(cursor_factory)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        count_sql(0)
+        return super().commit()
+
+
+def write_report(path: str, **details) -> dict:
+    """Writes the recorded stages to a JSON run report"""
+    report = {"written_at": datetime.now().isoformat(), **details, "stages": stages}
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    return report
@@ -2,10 +2,16 @@ DROP DATABASE IF EXISTS thermomix;
 CREATE DATABASE thermomix;
 --\c thermomix;
 
-DROP TABLE IF EXISTS roles;
-DROP TABLE IF EXISTS members;
+DROP MATERIALIZED VIEW IF EXISTS recruits_overview;
+DROP TABLE IF EXISTS recruit_sources CASCADE;
+DROP TABLE IF EXISTS load_checkpoints CASCADE;
+DROP TABLE IF EXISTS quarantined_recruits CASCADE;
+DROP TABLE IF EXISTS roles CASCADE;
+DROP TABLE IF EXISTS members CASCADE;
 DROP TABLE IF EXISTS calendar_dates CASCADE;
 DROP TABLE IF EXISTS member_details CASCADE;
+DROP TABLE IF EXISTS member_newcomer_demos CASCADE;
+DROP TABLE IF EXISTS member_sale_events CASCADE;
 DROP TABLE IF EXISTS member_sales CASCADE;
 DROP TABLE IF EXISTS member_relationships CASCADE;
 
@@ -35,30 +41,94 @@ CREATE TABLE member_details (
   training_date_id_fk INTEGER REFERENCES calendar_dates(training_date_id)
 );
 
-CREATE TABLE member_sales (
+CREATE TABLE member_newcomer_demos (
+  member_id_fk INTEGER PRIMARY KEY REFERENCES members(member_id) ON DELETE CASCADE,
+  newcomer_demo DATE
+);
+
+CREATE TABLE member_sale_events (
   member_id_fk INTEGER REFERENCES members(member_id) ON DELETE CASCADE,
-  newcomer_demo DATE,
-  first_sale VARCHAR(20) CHECK (first_sale IS NULL OR first_sale = 'DNQ' OR TO_DATE(first_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  second_sale VARCHAR(20) CHECK (second_sale IS NULL OR second_sale = 'DNQ' OR TO_DATE(second_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  third_sale VARCHAR(20) CHECK (third_sale IS NULL OR third_sale = 'DNQ' OR TO_DATE(third_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  fourth_sale VARCHAR(20) CHECK (fourth_sale IS NULL OR fourth_sale = 'DNQ' OR TO_DATE(fourth_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  fifth_sale VARCHAR(20) CHECK (fifth_sale IS NULL OR fifth_sale = 'DNQ' OR TO_DATE(fifth_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  sixth_sale VARCHAR(20) CHECK (sixth_sale IS NULL OR sixth_sale = 'DNQ' OR TO_DATE(sixth_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  seventh_sale VARCHAR(20) CHECK (seventh_sale IS NULL OR seventh_sale = 'DNQ' OR TO_DATE(seventh_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL),
-  eighth_sale VARCHAR(20) CHECK (eighth_sale IS NULL OR eighth_sale = 'DNQ' OR TO_DATE(eighth_sale, 'YYYY-MM-DD HH24:MI:SS') IS NOT NULL)
+  sale_number SMALLINT CHECK (sale_number BETWEEN 1 AND 8),
+  sale_date DATE,
+  status TEXT NOT NULL CHECK (status IN ('SALE', 'DNQ')),
+  PRIMARY KEY (member_id_fk, sale_number),
+  CHECK (status = 'DNQ' OR sale_date IS NOT NULL)
 );
 
+-- Keeps the old one-row-per-member shape for readers such as the dashboard
+CREATE VIEW member_sales AS
+SELECT COALESCE(d.member_id_fk, e.member_id_fk) AS member_id_fk,
+  d.newcomer_demo,
+  e.first_sale,
+  e.second_sale,
+  e.third_sale,
+  e.fourth_sale,
+  e.fifth_sale,
+  e.sixth_sale,
+  e.seventh_sale,
+  e.eighth_sale
+FROM member_newcomer_demos d
+FULL JOIN (
+  SELECT member_id_fk,
+    MAX(sale) FILTER (WHERE sale_number = 1) AS first_sale,
+    MAX(sale) FILTER (WHERE sale_number = 2) AS second_sale,
+    MAX(sale) FILTER (WHERE sale_number = 3) AS third_sale,
+    MAX(sale) FILTER (WHERE sale_number = 4) AS fourth_sale,
+    MAX(sale) FILTER (WHERE sale_number = 5) AS fifth_sale,
+    MAX(sale) FILTER (WHERE sale_number = 6) AS sixth_sale,
+    MAX(sale) FILTER (WHERE sale_number = 7) AS seventh_sale,
+    MAX(sale) FILTER (WHERE sale_number = 8) AS eighth_sale
+  FROM (SELECT member_id_fk, sale_number,
+          CASE WHEN status = 'DNQ' THEN 'DNQ' ELSE TO_CHAR(sale_date, 'YYYY-MM-DD HH24:MI:SS') END AS sale
+        FROM member_sale_events) events
+  GROUP BY member_id_fk
+) e ON e.member_id_fk = d.member_id_fk;
+
 CREATE TABLE member_relationships (
   member_relationship_id_fk INTEGER REFERENCES members(member_id) ON DELETE CASCADE,
   team_leader_id INTEGER,
   recruiting_advisor_id INTEGER
 );
 
+-- Source row fingerprints used by incremental loads
+CREATE TABLE recruit_sources (
+  source_year INTEGER NOT NULL,
+  recruit_key TEXT NOT NULL,
+  member_id_fk INTEGER REFERENCES members(member_id) ON DELETE CASCADE,
+  row_hash TEXT NOT NULL,
+  loaded_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (source_year, recruit_key)
+);
+
+-- Last committed batch of each year's streamed load, so an interrupted load can resume
+CREATE TABLE load_checkpoints (
+  source_year INTEGER PRIMARY KEY,
+  source_hash TEXT NOT NULL,
+  batch_size INTEGER NOT NULL,
+  last_batch INTEGER NOT NULL,
+  completed BOOLEAN NOT NULL DEFAULT FALSE,
+  updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Source rows that failed validation, with the reason, left out of the load
+CREATE TABLE quarantined_recruits (
+  source_year INTEGER NOT NULL,
+  recruit_key TEXT NOT NULL,
+  name TEXT,
+  reason TEXT NOT NULL,
+  source_row JSONB,
+  quarantined_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (source_year, recruit_key)
+);
+
 -- Index creation for faster lookups
 CREATE INDEX idx_member_details_training_date_id_fk ON member_details(training_date_id_fk);
-CREATE INDEX idx_member_details_member_id ON member_details(member_id_details_fk);
-CREATE INDEX idx_member_sales_member_id ON member_sales(member_id_fk);
-CREATE INDEX idx_member_relationships_member_id ON member_relationships(member_relationship_id_fk);
+
+-- One row per member, so loads can upsert with ON CONFLICT
+CREATE UNIQUE INDEX idx_member_details_member_id ON member_details(member_id_details_fk);
+CREATE INDEX idx_member_sale_events_sale_date ON member_sale_events(sale_date);
+CREATE UNIQUE INDEX idx_member_relationships_member_id ON member_relationships(member_relationship_id_fk);
+CREATE UNIQUE INDEX idx_calendar_dates_training_date ON calendar_dates(training_date, start_date);
 
 INSERT INTO roles(role_id, role_name) VALUES (1, 'Team Leader'),(2, 'Advisor');
 INSERT INTO calendar_dates(training_date_id, training_date, start_date, thirty_days, ninety_days, one_eighty_days) VALUES (0, NULL, NULL, NULL, NULL, NULL);
@@ -67,4 +137,45 @@ INSERT INTO members(name, role_id_fk) VALUES ('Miranda Quantrill', 1),
 ('Judi Hampton',1),
 ('Malgorzata Strzelecka',1),
 ('Alina Matei',1),
-('Sara Joiner-Jarrett',1);
\ No newline at end of file
+('Sara Joiner-Jarrett',1);
+
+-- The recruits table of the dashboard and team reports, joined once and refreshed after every load and dashboard write.
+-- It has no ORDER BY; readers sort in their own queries.
+-- The unique index lets REFRESH MATERIALIZED VIEW CONCURRENTLY run without blocking readers.
+CREATE MATERIALIZED VIEW recruits_overview AS
+SELECT
+  m.member_id,
+  m.name AS member_name,
+  tl.name AS team_leader_name,
+  ra.name AS recruiting_advisor_name,
+  r.role_name,
+  md.purchase,
+  cd.training_date,
+  cd.start_date,
+  cd.thirty_days,
+  cd.ninety_days,
+  cd.one_eighty_days,
+  ms.newcomer_demo,
+  ms.first_sale,
+  ms.second_sale,
+  ms.third_sale,
+  ms.fourth_sale,
+  ms.fifth_sale,
+  ms.sixth_sale,
+  ms.seventh_sale,
+  ms.eighth_sale
+FROM members m
+JOIN roles r ON m.role_id_fk = r.role_id
+LEFT JOIN member_details md ON m.member_id = md.member_id_details_fk
+LEFT JOIN calendar_dates cd ON md.training_date_id_fk = cd.training_date_id
+LEFT JOIN member_sales ms ON m.member_id = ms.member_id_fk
+LEFT JOIN member_relationships mr ON m.member_id = mr.member_relationship_id_fk
+LEFT JOIN members tl ON mr.team_leader_id = tl.member_id
+LEFT JOIN members ra ON mr.recruiting_advisor_id = ra.member_id;
+
+CREATE UNIQUE INDEX idx_recruits_overview_member_id ON recruits_overview(member_id);
+CREATE INDEX idx_recruits_overview_team_leader ON recruits_overview(team_leader_name, role_name);
+CREATE INDEX idx_recruits_overview_member_name ON recruits_overview(member_name);
+
+-- Keyset pagination of the dashboard's recruits table by (team leader, member id)
+CREATE INDEX idx_recruits_overview_page ON recruits_overview((COALESCE(team_leader_name, '')), member_id);
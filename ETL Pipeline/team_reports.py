@@ -0,0 +1,114 @@
+"""Writes a recruits and milestones report for every team leader, rendered in parallel"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import html
+import os
+import re
+import pandas as pd
+from frame_schema import REPORT_SCHEMA, apply_schema
+from Load.load import get_db_connection
+from run_report import stage, write_report
+from Transform.cleaning import SALE_COLUMNS, SALE_DATE_FORMAT
+
+REPORT_FORMATS = ["xlsx", "csv", "html"]
+UNASSIGNED = "No Team Leader"
+MILESTONE_COLUMNS = ['thirty_days', 'ninety_days', 'one_eighty_days']
+
+# recruits_overview is the materialized recruits join, refreshed after every load and dashboard write;
+# members without details, e.g. team leaders and advisors added by name only, aren't recruits
+RECRUITS_SQL = """
+SELECT member_id, member_name, team_leader_name, recruiting_advisor_name, role_name, purchase, training_date,
+       start_date, thirty_days, ninety_days, one_eighty_days, newcomer_demo, first_sale, second_sale, third_sale,
+       fourth_sale, fifth_sale, sixth_sale, seventh_sale, eighth_sale
+FROM recruits_overview
+WHERE member_id IN (SELECT member_id_details_fk FROM member_details)
+ORDER BY team_leader_name, member_name;
+"""
+
+
+def read_recruits(conn_current) -> pd.DataFrame:
+    """Pulls every recruit with their calendar milestones and sales in one query"""
+    cur = conn_current.cursor()
+    cur.execute(RECRUITS_SQL)
+    df = pd.DataFrame(cur.fetchall(), columns=[desc[0] for desc in cur.description])
+    cur.close()
+    return apply_schema(df, REPORT_SCHEMA)
+
+
+def add_milestone_sales(df: pd.DataFrame) -> pd.DataFrame:
+    """Counts each recruit's sales made by their 30, 90 and 180 day milestones"""
+    sale_dates = df[SALE_COLUMNS].apply(lambda column: pd.to_datetime(column, format=SALE_DATE_FORMAT, errors='coerce'))
+    return df.assign(**{f"sales_by_{milestone}": sale_dates.le(df[milestone], axis=0).sum(axis=1)
+                        for milestone in MILESTONE_COLUMNS})
+
+
+def summarise_milestones(df: pd.DataFrame) -> pd.DataFrame:
+    """Summarises a team's recruits per training date: recruits, demos and sales by each milestone"""
+    summary = df.groupby('training_date', observed=True, sort=False).agg(
+        start_date=('start_date', 'first'),
+        recruits=('member_id', 'count'),
+        newcomer_demos=('newcomer_demo', 'count'),
+        **{f"sales_by_{milestone}": (f"sales_by_{milestone}", 'sum') for milestone in MILESTONE_COLUMNS})
+    return summary.sort_values('start_date').reset_index()
+
+
+def report_name(team_leader: str) -> str:
+    """Turns a team leader's name into a file name"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", team_leader).strip("_") or "team_leader"
+
+
+def render_team_report(team_leader: str, df: pd.DataFrame, output: str, formats: list[str]) -> list[str]:
+    """Writes one team leader's recruits and milestone summary in each of the formats, returning the paths"""
+    recruits = df.drop(columns=['team_leader_name'])
+    summary = summarise_milestones(df)
+    base = os.path.join(output, report_name(team_leader))
+    paths = []
+    if "xlsx" in formats:
+        with pd.ExcelWriter(f"{base}.xlsx", engine="openpyxl") as writer:
+            recruits.to_excel(writer, sheet_name="Recruits", index=False)
+            summary.to_excel(writer, sheet_name="Milestones", index=False)
+        paths.append(f"{base}.xlsx")
+    if "csv" in formats:
+        recruits.to_csv(f"{base}.csv", index=False)
+        paths.append(f"{base}.csv")
+    if "html" in formats:
+        with open(f"{base}.html", "w") as html_file:
+            html_file.write(f"<h1>{html.escape(team_leader)}</h1>\n<h2>Milestones</h2>\n{summary.to_html(index=False, na_rep='')}\n"
+                            f"<h2>Recruits</h2>\n{recruits.to_html(index=False, na_rep='')}\n")
+        paths.append(f"{base}.html")
+    return paths
+
+
+def write_team_reports(output: str = "Reports", formats: list[str] = REPORT_FORMATS, max_workers: int = None) -> dict:
+    """Reads the recruits once, splits them by team leader and renders every team's report across a process pool"""
+    with stage("report.read") as record:
+        conn_thermomix = get_db_connection()
+        df = add_milestone_sales(read_recruits(conn_thermomix))
+        conn_thermomix.close()
+        record["rows_out"] = len(df)
+
+    teams = df.assign(team_leader_name=df['team_leader_name'].cat.add_categories([UNASSIGNED]).fillna(UNASSIGNED))
+    os.makedirs(output, exist_ok=True)
+    with stage("report.render", rows_in=len(df)) as record:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {team_leader: pool.submit(render_team_report, team_leader, team_df, output, formats)
+                       for team_leader, team_df in teams.groupby('team_leader_name', observed=True)}
+            reports = {team_leader: future.result() for team_leader, future in futures.items()}
+        record["rows_out"] = len(reports)
+    print(f"Wrote reports for {len(reports)} team leaders to {output}.")
+    return reports
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Writes a recruits and milestones report for every team leader")
+    parser.add_argument("--output", default="Reports", help="folder the reports are written to")
+    parser.add_argument("--formats", nargs="+", choices=REPORT_FORMATS, default=REPORT_FORMATS)
+    parser.add_argument("--workers", type=int, default=None, help="processes used to render the reports")
+    parser.add_argument("--report", default="team_reports_run.json", help="where to write the JSON run report")
+    args = parser.parse_args()
+
+    try:
+        write_team_reports(args.output, args.formats, args.workers)
+    finally:
+        write_report(args.report, arguments=vars(args))
@@ -0,0 +1,20 @@
+"""Tests for the per-team-leader reports"""
+import datetime
+import pandas as pd
+from frame_schema import REPORT_SCHEMA, apply_schema
+from team_reports import add_milestone_sales, render_team_report
+
+
+def test_html_report_escapes_the_team_leader(tmp_path):
+    start = datetime.datetime(2024, 1, 1)
+    recruits = apply_schema(pd.DataFrame({
+        'member_id': [1], 'member_name': ["Ava <b>Taylor</b>"], 'team_leader_name': ["Judi <Hampton> & Co"],
+        'training_date': ["JANUARY 2024"], 'start_date': [start], 'thirty_days': [start + datetime.timedelta(days=30)],
+        'ninety_days': [start + datetime.timedelta(days=90)], 'one_eighty_days': [start + datetime.timedelta(days=180)],
+        'newcomer_demo': [start], 'first_sale': ["2024-01-10 00:00:00"], 'second_sale': ["DNQ"],
+        **{column: [None] for column in ['third_sale', 'fourth_sale', 'fifth_sale', 'sixth_sale', 'seventh_sale', 'eighth_sale']}
+    }), REPORT_SCHEMA)
+    [path] = render_team_report("Judi <Hampton> & Co", add_milestone_sales(recruits), str(tmp_path), ["html"])
+    page = open(path).read()
+    assert "<h1>Judi &lt;Hampton&gt; &amp; Co</h1>" in page
+    assert "<b>" not in page
@@ -0,0 +1,135 @@
+"""Watches the ExcelSheets folder and applies workbook changes to the database as they are saved"""
+from fnmatch import fnmatch
+import os
+import threading
+import time
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from Transform.transform import (RECRUITS_SHEET_PATTERN, TRAINING_DATES_PATTERN, discover_workbooks, file_hash,
+                                 read_clean_recruits, read_training_dates, sheet_fingerprints, year_from_name)
+from Load.load import get_db_connection, incremental_populate_database, refresh_recruits_overview
+from Load.calendar_dates import generate_calendar
+
+DEBOUNCE_SECONDS = 2.0
+POLL_SECONDS = 0.5
+
+
+class WorkbookEvents(FileSystemEventHandler):
+    """Collects the workbooks touched by file system events, ignoring Excel's lock files,
+    and hands them over once the saves have settled"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.last_event = 0.0
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            name = os.path.basename(path)
+            if name.endswith(".xlsx") and not name.startswith("~$"):
+                with self.lock:
+                    self.paths.add(f"{self.source}/{name}")
+                    self.last_event = time.monotonic()
+
+    def settled(self, debounce: float = DEBOUNCE_SECONDS) -> set:
+        """Returns and forgets the touched workbooks once no event has arrived for debounce seconds"""
+        with self.lock:
+            if not self.paths or time.monotonic() - self.last_event < debounce:
+                return set()
+            paths, self.paths = self.paths, set()
+            return paths
+
+
+class WorkbookWatcher:
+    """Remembers the fingerprint and parse of every sheet it has loaded, so a save re-parses
+    only the sheets that changed and loads only the years they belong to"""
+
+    def __init__(self, source: str = 'ExcelSheets'):
+        self.source = source
+        self.conn = get_db_connection()
+        self.fingerprints = {}
+        self.recruits = {}
+        self.training_dates = {}
+
+    def changed_sheets(self, path: str) -> dict:
+        """Returns the fingerprint of each sheet in a workbook that differs from the last one loaded"""
+        if fnmatch(os.path.basename(path), TRAINING_DATES_PATTERN):
+            fingerprints = {"training dates": file_hash(path)}
+        else:
+            fingerprints = {sheet_name: fingerprint for sheet_name, fingerprint in sheet_fingerprints(path).items()
+                            if fnmatch(sheet_name, RECRUITS_SHEET_PATTERN)}
+        return {(path, sheet_name): fingerprint for sheet_name, fingerprint in fingerprints.items()
+                if self.fingerprints.get((path, sheet_name)) != fingerprint}
+
+    def refresh(self, paths) -> None:
+        """Re-parses the changed sheets of the given workbooks and applies each affected year incrementally"""
+        changed_years = {}
+        for path in sorted(paths):
+            if not os.path.exists(path):
+                print(f"{path} was removed; its recruits are left in the database.")
+                continue
+            try:
+                for (_, sheet_name), fingerprint in self.changed_sheets(path).items():
+                    if sheet_name == "training dates":
+                        year = year_from_name(os.path.basename(path))
+                        self.training_dates[year] = read_training_dates(path)
+                    else:
+                        year = year_from_name(sheet_name)
+                        self.recruits[year] = read_clean_recruits(path, sheet_name)
+                    changed_years.setdefault(year, []).append(((path, sheet_name), fingerprint))
+            except Exception as err:
+                # Usually a workbook caught halfway through a save; the next event retries it
+                print(f"Could not read {path}: {err}")
+
+        loaded = False
+        for year, fingerprints in sorted(changed_years.items()):
+            if year not in self.recruits:
+                print(f"Training dates for {year} changed, but there is no {year} recruits sheet to load them with.")
+                continue
+            dates_df = self.training_dates.get(year)
+            calendar_df = generate_calendar(year, overrides=dates_df)
+            try:
+                if self.conn.closed:
+                    self.conn = get_db_connection()
+                incremental_populate_database(self.conn, self.recruits[year], calendar_df, year)
+            except Exception as err:
+                print(f"Could not load {year}: {err}")
+                if not self.conn.closed:
+                    self.conn.rollback()
+                continue
+            self.fingerprints.update(fingerprints)
+            loaded = True
+
+        if loaded:
+            try:
+                refresh_recruits_overview(self.conn)
+            except Exception as err:
+                print(f"Could not refresh recruits_overview: {err}")
+                if not self.conn.closed:
+                    self.conn.rollback()
+
+    def watch(self, debounce: float = DEBOUNCE_SECONDS) -> None:
+        """Brings the database up to date with every workbook, then applies changes as they are saved"""
+        recruits_paths, training_dates_paths = discover_workbooks(self.source)
+        self.refresh(recruits_paths + training_dates_paths)
+
+        events = WorkbookEvents(self.source)
+        observer = Observer()
+        observer.schedule(events, self.source, recursive=False)
+        observer.start()
+        print(f"Watching {self.source} for workbook changes.")
+        try:
+            while True:
+                time.sleep(POLL_SECONDS)
+                paths = events.settled(debounce)
+                if paths:
+                    self.refresh(paths)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            observer.stop()
+            observer.join()
+            self.conn.close()